@@ -0,0 +1,24 @@
+import argparse
+
+import bench
+import export
+import server
+import simulate
+
+
+def main():
+    # Command line entry point: python -m 2048 <command> [options]
+    parser = argparse.ArgumentParser(prog="python -m 2048", description="Headless tools for 2048")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    simulate.add_arguments(subparsers.add_parser("simulate", help="play many games headlessly and report statistics"))
+    bench.add_arguments(subparsers.add_parser("bench", help="measure engine and rendering speed"))
+    server.add_arguments(subparsers.add_parser("serve", help="host game sessions over a line-delimited JSON socket"))
+    export.add_arguments(subparsers.add_parser("export", help="render a recorded game to PNG or raw video frames"))
+
+    args = parser.parse_args()
+    args.run(args)
+
+
+if __name__ == "__main__":
+    main()
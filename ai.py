@@ -0,0 +1,272 @@
+import argparse
+import time
+from collections import OrderedDict
+
+import bitboard
+from engine import DEFAULT_SPAWN, DIRECTIONS, SPAWN_DISTRIBUTIONS, Board, Game, GameRandom, spawn_probabilities
+from positions import DEFAULT_MIN_VISITS, PositionStore
+from tables import get_tables
+
+# --- Search Constants ---
+DEFAULT_TIME_BUDGET_MS = 100
+TRANSPOSITION_TABLE_SIZE = 200_000  # Maximum number of cached chance nodes
+PROBABILITY_CUTOFF = 0.0001  # Chance branches less likely than this are evaluated statically
+DEADLINE_CHECK_INTERVAL = 256  # Nodes searched between clock checks
+
+# Heuristic score of every 16-bit row, from the shared table file (the weights live in tables.py);
+# loaded by the first evaluation like the bitboard move tables
+ROW_HEURISTIC = None
+
+
+def evaluate(bits):
+    # Static evaluation of a bitboard: row heuristics over the rows and the columns
+    global ROW_HEURISTIC
+    table = ROW_HEURISTIC
+    if table is None:
+        table = ROW_HEURISTIC = get_tables().heuristic
+    transposed = bitboard.transpose(bits)
+    return (
+        table[bits & 0xFFFF]
+        + table[(bits >> 16) & 0xFFFF]
+        + table[(bits >> 32) & 0xFFFF]
+        + table[(bits >> 48) & 0xFFFF]
+        + table[transposed & 0xFFFF]
+        + table[(transposed >> 16) & 0xFFFF]
+        + table[(transposed >> 32) & 0xFFFF]
+        + table[(transposed >> 48) & 0xFFFF]
+    )
+
+
+def search_depth(empty):
+    # Search deeper when the board is crowded and the branching factor is small
+    if empty >= 8:
+        return 2
+    if empty >= 4:
+        return 3
+    if empty >= 2:
+        return 4
+    return 5
+
+
+# --- Transposition Table ---
+class TranspositionTable:
+    # Bounded cache of chance node values with least-recently-used eviction
+    def __init__(self, max_size=TRANSPOSITION_TABLE_SIZE):
+        self.max_size = max_size
+        self.entries = OrderedDict()  # bits -> (depth, value)
+        self.lookups = 0
+        self.hits = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, bits, depth):
+        # Return the cached value if it was searched at least this deep, otherwise None
+        self.lookups += 1
+        entry = self.entries.get(bits)
+        if entry is None or entry[0] < depth:
+            return None
+        self.entries.move_to_end(bits)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, bits, depth, value):
+        self.entries[bits] = (depth, value)
+        self.entries.move_to_end(bits)
+        if len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        self.entries.clear()
+
+    @property
+    def hit_rate(self):
+        return self.hits / self.lookups if self.lookups else 0.0
+
+
+class SearchTimeout(Exception):
+    # Raised inside the search when the time budget runs out
+    pass
+
+
+# --- Search Statistics ---
+class SearchStats:
+    def __init__(self):
+        self.searches = 0
+        self.nodes = 0
+        self.elapsed = 0.0
+        self.depth = 0  # Deepest fully completed iteration of the last search
+        self.book_moves = 0  # Moves taken from the position store without searching
+
+    @property
+    def nodes_per_second(self):
+        return self.nodes / self.elapsed if self.elapsed else 0.0
+
+
+# --- Expectimax Search ---
+class Searcher:
+    # Iterative-deepening expectimax over the spawn distribution, with a shared transposition table
+    # spawn names the engine spawn distribution the game uses, so chance nodes weigh tiles the same way
+    # positions is an optional positions.PositionStore; a position where some move was played at least
+    # min_visits times is answered with the recorded best of those moves instead of a search
+    def __init__(
+        self,
+        table_size=TRANSPOSITION_TABLE_SIZE,
+        probability_cutoff=PROBABILITY_CUTOFF,
+        spawn=DEFAULT_SPAWN,
+        positions=None,
+        min_visits=DEFAULT_MIN_VISITS,
+    ):
+        self.table = TranspositionTable(table_size)
+        self.positions = positions
+        self.min_visits = min_visits
+        self.probability_cutoff = probability_cutoff
+        # (exponent, probability) of each spawn value
+        self.spawn_probabilities = [
+            (value.bit_length() - 1, probability) for value, probability in spawn_probabilities(spawn)
+        ]
+        self.stats = SearchStats()
+        self._deadline = None
+        self._nodes_until_check = DEADLINE_CHECK_INTERVAL
+
+    def best_move(self, board, time_budget_ms=DEFAULT_TIME_BUDGET_MS, max_depth=None):
+        # Return the best direction for an engine Board or bitboard, or None if no move is possible
+        # With time_budget_ms=None the search always completes max_depth, which keeps it reproducible
+        bits = bitboard.encode(board) if isinstance(board, Board) else board
+        start = time.perf_counter()
+        self._deadline = start + time_budget_ms / 1000 if time_budget_ms is not None else float("inf")
+        self._nodes_until_check = DEADLINE_CHECK_INTERVAL
+        self.stats.searches += 1
+
+        # Start from the best static move, so a direction is returned even if depth 1 times out
+        children = []
+        for direction in DIRECTIONS:
+            child, score, moved = bitboard.move(bits, direction)
+            if moved:
+                children.append((direction, child, score))
+        if not children:
+            return None
+        if self.positions is not None:
+            suggestion = self.positions.suggest(
+                board if isinstance(board, Board) else bitboard.decode(bits), self.min_visits
+            )
+            if suggestion is not None and any(direction == suggestion for direction, _, _ in children):
+                self.stats.book_moves += 1
+                self.stats.depth = 0
+                self.stats.elapsed += time.perf_counter() - start
+                return suggestion
+        best = max(children, key=lambda child: evaluate(child[1]) + child[2])[0]
+
+        if max_depth is None:
+            max_depth = search_depth(bitboard.count_empty(bits))
+        self.stats.depth = 0
+        try:
+            for depth in range(1, max_depth + 1):
+                values = {
+                    direction: self._chance_node(child, depth, 1.0) + score for direction, child, score in children
+                }
+                best = max(values, key=values.get)
+                self.stats.depth = depth
+        except SearchTimeout:
+            pass
+        finally:
+            self.stats.elapsed += time.perf_counter() - start
+        return best
+
+    def _check_deadline(self):
+        self.stats.nodes += 1
+        self._nodes_until_check -= 1
+        if self._nodes_until_check <= 0:
+            self._nodes_until_check = DEADLINE_CHECK_INTERVAL
+            if time.perf_counter() > self._deadline:
+                raise SearchTimeout
+
+    def _max_node(self, bits, depth, probability):
+        # The player picks the move with the highest expected value
+        self._check_deadline()
+        best = 0.0  # A dead position is worth nothing
+        for direction in DIRECTIONS:
+            child, score, moved = bitboard.move(bits, direction)
+            if moved:
+                value = self._chance_node(child, depth, probability) + score
+                if value > best:
+                    best = value
+        return best
+
+    def _chance_node(self, bits, depth, probability):
+        # A tile spawns uniformly in an empty cell, its value drawn from the spawn distribution
+        self._check_deadline()
+        if depth <= 0 or probability < self.probability_cutoff:
+            return evaluate(bits)
+        cached = self.table.get(bits, depth)
+        if cached is not None:
+            return cached
+
+        empty = bitboard.empty_cells(bits)
+        if not empty:
+            return evaluate(bits)
+        cell_probability = probability / len(empty)
+        total = 0.0
+        for index in empty:
+            shift = 4 * index
+            for exponent, spawn_probability in self.spawn_probabilities:
+                child = bits | (exponent << shift)
+                total += spawn_probability * self._max_node(child, depth - 1, cell_probability * spawn_probability)
+        value = total / len(empty)
+        self.table.put(bits, depth, value)
+        return value
+
+
+_DEFAULT_SEARCHER = None
+
+
+def best_move(board, time_budget_ms=DEFAULT_TIME_BUDGET_MS):
+    # Library entry point sharing one searcher, so the transposition table persists between moves
+    global _DEFAULT_SEARCHER
+    if _DEFAULT_SEARCHER is None:
+        _DEFAULT_SEARCHER = Searcher()
+    return _DEFAULT_SEARCHER.best_move(board, time_budget_ms)
+
+
+def format_stats(searcher):
+    stats, table = searcher.stats, searcher.table
+    return (
+        f"searches={stats.searches} nodes={stats.nodes} nodes/s={stats.nodes_per_second:,.0f} "
+        f"depth={stats.depth} tt_size={len(table)} tt_hit_rate={table.hit_rate:.1%} tt_evictions={table.evictions} "
+        f"book_moves={stats.book_moves}"
+    )
+
+
+# --- Command Line ---
+def main():
+    # Play one headless game with the AI and report search throughput
+    parser = argparse.ArgumentParser(description="Play 2048 headlessly with the expectimax AI")
+    parser.add_argument("--budget", type=int, default=DEFAULT_TIME_BUDGET_MS, help="time budget per move in ms")
+    parser.add_argument("--seed", type=int, default=None, help="seed for the tile spawns")
+    parser.add_argument("--spawn", choices=SPAWN_DISTRIBUTIONS, default=DEFAULT_SPAWN, help="spawn distribution")
+    parser.add_argument("--max-moves", type=int, default=None, help="stop after this many moves")
+    parser.add_argument("--positions", default=None, help="position store to take known moves from")
+    parser.add_argument(
+        "--min-visits", type=int, default=DEFAULT_MIN_VISITS, help="times a stored move must have been played"
+    )
+    args = parser.parse_args()
+
+    game = Game(GameRandom(args.seed, args.spawn))
+    store = PositionStore(args.positions) if args.positions is not None else None
+    searcher = Searcher(spawn=args.spawn, positions=store, min_visits=args.min_visits)
+    while game.state != "lost" and (args.max_moves is None or game.moves < args.max_moves):
+        if game.state == "won":
+            game.keep_playing()
+        direction = searcher.best_move(game.board, args.budget)
+        if direction is None or not game.move(direction):
+            break
+
+    print(game.board)
+    print(f"score={game.score} moves={game.moves} max_tile={game.board.max_tile()}")
+    print(format_stats(searcher))
+
+
+if __name__ == "__main__":
+    main()
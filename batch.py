@@ -0,0 +1,229 @@
+import numpy as np
+
+from engine import (
+    COLS,
+    DEFAULT_SPAWN,
+    DIRECTIONS,
+    ROWS,
+    SPAWN_VALUES,
+    START_TILES,
+    START_VALUE,
+    Board,
+    get_lines,
+    spawn_probabilities,
+)
+
+# --- Batch Constants ---
+# Directions are passed as indices into engine.DIRECTIONS: 0 up, 1 down, 2 left, 3 right
+DIRECTION_INDEX = {direction: index for index, direction in enumerate(DIRECTIONS)}
+SPAWN_EXPONENTS = np.array([value.bit_length() - 1 for value in SPAWN_VALUES], dtype=np.uint8)
+START_EXPONENT = START_VALUE.bit_length() - 1
+# SplitMix64 constants used by CounterRandom
+GOLDEN_GAMMA = np.uint64(0x9E3779B97F4A7C15)
+MIX_MULTIPLIERS = (np.uint64(0xBF58476D1CE4E5B9), np.uint64(0x94D049BB133111EB))
+
+
+# --- Counter-Based RNG ---
+def _mix(values):
+    # SplitMix64 finaliser over a uint64 array: a bijection that spreads every input bit over the output
+    values = (values ^ (values >> np.uint64(30))) * MIX_MULTIPLIERS[0]
+    values = (values ^ (values >> np.uint64(27))) * MIX_MULTIPLIERS[1]
+    return values ^ (values >> np.uint64(31))
+
+
+class CounterRandom:
+    # Counter-based generator for BatchBoard: draw n of board i is a hash of (seed, ids[i], n), computed
+    # for every board at once in a few array operations, with no state beyond the draw counter
+    # Each board has its own stream, so a batch can be split across workers by giving each worker its
+    # slice of ids, and any draw can be recomputed without replaying the draws before it
+    # Implements the two numpy Generator methods BatchBoard uses, random and integers
+    def __init__(self, seed, ids):
+        # ids is a board count, or an array of board ids (e.g. a worker's slice of a larger run)
+        self.ids = np.arange(ids, dtype=np.uint64) if np.isscalar(ids) else np.asarray(ids, dtype=np.uint64)
+        seed_key = _mix(np.array([seed & 0xFFFFFFFFFFFFFFFF], dtype=np.uint64))
+        self.keys = _mix(seed_key + self.ids * GOLDEN_GAMMA)
+        self.counter = 0  # Draws made so far by every board
+
+    def _bits(self, size):
+        # (boards, draws) array of fresh 64-bit values, advancing the counter
+        size = (size,) if np.isscalar(size) else tuple(size)
+        if size[0] != len(self.ids):
+            raise ValueError(f"CounterRandom has {len(self.ids)} streams, asked for {size[0]} rows")
+        draws = int(np.prod(size[1:], dtype=np.int64))
+        steps = np.arange(self.counter, self.counter + draws, dtype=np.uint64) * GOLDEN_GAMMA
+        self.counter += draws
+        return _mix(self.keys[:, None] + steps[None, :]).reshape(size)
+
+    def random(self, size):
+        # Floats in [0, 1) from the top 53 bits
+        return (self._bits(size) >> np.uint64(11)).astype(np.float64) * (1.0 / (1 << 53))
+
+    def integers(self, high, size):
+        # Integers in [0, high), by scaling rather than rejection, so the bias is below high / 2**53
+        return (self.random(size) * high).astype(np.int64)
+
+
+# --- Vectorized Line Helpers ---
+def _compact(lines):
+    # Slide the non-empty cells of every line to the front, keeping their order
+    order = np.argsort(lines == 0, axis=1, kind="stable")
+    return np.take_along_axis(lines, order, axis=1)
+
+
+def merge_lines(lines):
+    # Vectorized engine.merge_line over an (M, P) array of exponents, sliding towards index 0
+    # Returns the merged lines and the score gained by each line
+    lines = _compact(lines)
+    scores = np.zeros(len(lines), dtype=np.int64)
+    for position in range(lines.shape[1] - 1):
+        current = lines[:, position]
+        merge = (current != 0) & (current == lines[:, position + 1])
+        # The merged cell is emptied, so the result can never merge again in this move
+        lines[merge, position] += 1
+        lines[merge, position + 1] = 0
+        scores += np.where(merge, np.left_shift(np.int64(1), lines[:, position].astype(np.int64)), 0)
+    return _compact(lines), scores
+
+
+def _spawn_choice(count, rng, weights):
+    # Draw count spawn exponents; uniform weights use rng.integers so seeded batches keep their games
+    if len(set(weights)) == 1:
+        return SPAWN_EXPONENTS[rng.integers(len(SPAWN_EXPONENTS), size=count)]
+    bounds = np.cumsum(weights)[:-1]  # Without the last bound, rounding can never index past the end
+    return SPAWN_EXPONENTS[np.searchsorted(bounds, rng.random(count), side="right")]
+
+
+def _empty_choice(empty, rng):
+    # Pick one empty cell uniformly per row of a boolean (N, cells) mask with one random draw per cell
+    keys = rng.random(empty.shape)
+    keys[~empty] = -1.0
+    return keys.argmax(axis=1)
+
+
+# --- Batch Board ---
+class BatchBoard:
+    # N boards stored as an (N, rows, cols) uint8 array of log2 exponents, 0 marks an empty cell
+    # rng is a numpy Generator or a CounterRandom with one stream per board; spawn names the engine
+    # spawn distribution
+    def __init__(self, exponents, rng=None, spawn=DEFAULT_SPAWN):
+        self.exponents = np.ascontiguousarray(exponents, dtype=np.uint8)
+        if self.exponents.ndim != 3:
+            raise ValueError(f"Expected an (N, rows, cols) array, got shape {self.exponents.shape}")
+        self.rng = rng if rng is not None else np.random.default_rng()
+        self.spawn_weights = [probability for _, probability in spawn_probabilities(spawn)]
+        self._lines = {
+            index: np.array(get_lines(self.rows, self.cols, direction)) for index, direction in enumerate(DIRECTIONS)
+        }
+
+    @classmethod
+    def new(cls, count, rows=ROWS, cols=COLS, rng=None, spawn=DEFAULT_SPAWN):
+        # Create count fresh games, each with START_TILES tiles of START_VALUE
+        rng = rng if rng is not None else np.random.default_rng()
+        batch = cls(np.zeros((count, rows, cols), dtype=np.uint8), rng, spawn)
+        batch.reset(np.ones(count, dtype=bool))
+        return batch
+
+    @classmethod
+    def from_boards(cls, boards, rng=None, spawn=DEFAULT_SPAWN):
+        # Build a batch from a list of engine Boards of the same size
+        exponents = np.array(
+            [[value.bit_length() - 1 if value else 0 for value in board.cells] for board in boards], dtype=np.uint8
+        )
+        return cls(exponents.reshape(len(boards), boards[0].rows, boards[0].cols), rng, spawn)
+
+    def to_boards(self):
+        # Convert back to a list of engine Boards
+        values = np.where(self.exponents > 0, np.left_shift(1, self.exponents.astype(np.int64)), 0)
+        return [Board(cells.ravel().tolist(), self.rows, self.cols) for cells in values]
+
+    def __len__(self):
+        return self.exponents.shape[0]
+
+    @property
+    def rows(self):
+        return self.exponents.shape[1]
+
+    @property
+    def cols(self):
+        return self.exponents.shape[2]
+
+    def move(self, directions):
+        # Slide every board in its own direction without spawning
+        # Returns (new_exponents, rewards, moved) and leaves the batch unchanged
+        directions = np.broadcast_to(np.asarray(directions), (len(self),))
+        flat = self.exponents.reshape(len(self), -1)
+        result = flat.copy()
+        rewards = np.zeros(len(self), dtype=np.int64)
+        for index, lines in self._lines.items():
+            selected = np.flatnonzero(directions == index)
+            if not len(selected):
+                continue
+            group = flat[selected][:, lines]  # (boards, lines, positions)
+            merged, scores = merge_lines(group.reshape(-1, lines.shape[1]))
+            result[selected[:, None], lines.ravel()[None, :]] = merged.reshape(len(selected), -1)
+            rewards[selected] = scores.reshape(len(selected), -1).sum(axis=1)
+        moved = (result != flat).any(axis=1)
+        rewards[~moved] = 0
+        return result.reshape(self.exponents.shape), rewards, moved
+
+    def spawn(self, mask=None):
+        # Spawn one tile on every selected board that has an empty cell, all in one vectorized draw
+        # Returns the flat cell index chosen per board (-1 where nothing spawned)
+        flat = self.exponents.reshape(len(self), -1)
+        empty = flat == 0
+        active = empty.any(axis=1)
+        if mask is not None:
+            active &= mask
+        cells = _empty_choice(empty, self.rng)
+        values = _spawn_choice(len(self), self.rng, self.spawn_weights)
+        boards = np.flatnonzero(active)
+        flat[boards, cells[boards]] = values[boards]
+        return np.where(active, cells, -1)
+
+    def reset(self, mask):
+        # Replace the selected boards with fresh starting positions
+        flat = self.exponents.reshape(len(self), -1)
+        flat[mask] = 0
+        for _ in range(START_TILES):
+            empty = flat == 0
+            cells = _empty_choice(empty, self.rng)
+            boards = np.flatnonzero(mask)
+            flat[boards, cells[boards]] = START_EXPONENT
+
+    def is_terminal(self):
+        # A board is done when it is full and no two neighbours share a value
+        boards = self.exponents
+        full = (boards != 0).all(axis=(1, 2))
+        horizontal = (boards[:, :, 1:] == boards[:, :, :-1]).any(axis=(1, 2))
+        vertical = (boards[:, 1:, :] == boards[:, :-1, :]).any(axis=(1, 2))
+        return full & ~(horizontal | vertical)
+
+    def step(self, directions):
+        # Move every board, spawn a tile on the boards that changed, and report which games ended
+        # Returns (exponents, rewards, moved, done); the win screen of the GUI is not modelled here
+        self.exponents, rewards, moved = self.move(directions)
+        self.spawn(moved)
+        return self.exponents, rewards, moved, self.is_terminal()
+
+
+# --- Parity Check ---
+def check_parity(count=10000, rows=ROWS, cols=COLS, seed=0):
+    # Compare BatchBoard.move with the scalar engine on random boards, raising AssertionError on mismatch
+    rng = np.random.default_rng(seed)
+    exponents = rng.choice(np.array([0, 0, 0, 1, 1, 2, 3, 4], dtype=np.uint8), size=(count, rows, cols))
+    batch = BatchBoard(exponents, rng)
+    boards = batch.to_boards()
+    directions = rng.integers(len(DIRECTIONS), size=count)
+    result, rewards, moved = batch.move(directions)
+    expected = BatchBoard.from_boards([board.move(DIRECTIONS[d])[0] for board, d in zip(boards, directions)])
+    for index, (board, direction) in enumerate(zip(boards, directions)):
+        _, score, board_moved = board.move(DIRECTIONS[direction])
+        assert rewards[index] == score and moved[index] == board_moved, f"Mismatch on {board!r} {DIRECTIONS[direction]}"
+    assert (result == expected.exponents).all(), "Batch boards differ from the scalar engine"
+    assert (batch.is_terminal() == [board.is_terminal() for board in boards]).all(), "Terminal masks differ"
+    return count
+
+
+if __name__ == "__main__":
+    for size in ((4, 4), (3, 5), (8, 8)):
+        print(f"{size[0]}x{size[1]}: {check_parity(rows=size[0], cols=size[1])} boards match the scalar engine")
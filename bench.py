@@ -0,0 +1,292 @@
+import importlib.util
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+
+import bitboard
+from engine import DIRECTIONS, Board, Game
+
+# --- Benchmark Constants ---
+DEFAULT_DURATION = 0.5  # Seconds spent on each measurement
+DEFAULT_THRESHOLD = 0.15  # Allowed slowdown against the baseline before the run fails
+DEFAULT_SIZES = (4, 6, 8)
+POSITIONS = 1000  # Board positions sampled from random games for every workload
+LOGIC_MODULES = ("engine", "history", "replay", "bitboard", "ai")  # Game logic that tools and workers import
+IMPORT_BUDGET_MS = 50  # Slowest acceptable import of LOGIC_MODULES in a fresh interpreter
+IMPORT_REPEATS = 5  # Fresh interpreters per import measurement; the fastest run is kept
+
+
+# --- Helpers ---
+def commit_hash():
+    # Return the current git commit, or None outside a git checkout
+    try:
+        output = subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return output.stdout.strip()
+
+
+def sample_positions(count, rows=4, cols=4, seed=0):
+    # Collect realistic positions by playing random games
+    rng = random.Random(seed)
+    positions = []
+    while len(positions) < count:
+        game = Game(rng, rows, cols)
+        while game.state != "lost" and len(positions) < count:
+            if game.state == "won":
+                game.keep_playing()
+            game.move(rng.choice(DIRECTIONS))
+            positions.append(game.board)
+    return positions
+
+
+def measure(operation, duration):
+    # Call operation() until duration seconds have passed; it returns how many operations it ran
+    # Returns operations per second
+    operations = 0
+    start = time.perf_counter()
+    elapsed = 0.0
+    while elapsed < duration:
+        operations += operation()
+        elapsed = time.perf_counter() - start
+    return operations / elapsed
+
+
+def import_time_ms(modules):
+    # Time importing modules in a fresh interpreter, excluding the interpreter's own startup
+    code = f"import time; start = time.perf_counter(); import {', '.join(modules)}; print(time.perf_counter() - start)"
+    env = dict(os.environ, SDL_VIDEODRIVER="dummy", PYGAME_HIDE_SUPPORT_PROMPT="1")
+    timings = []
+    for _ in range(IMPORT_REPEATS):
+        output = subprocess.run(
+            [sys.executable, "-c", code],
+            capture_output=True,
+            text=True,
+            check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            env=env,
+        )
+        timings.append(float(output.stdout.split()[-1]) * 1000)
+    return min(timings)
+
+
+# --- Startup Benchmarks ---
+def bench_startup(results, rendering=True):
+    # Lower is better for these, unlike the rates below
+    results["startup.import_logic_ms"] = import_time_ms(LOGIC_MODULES)
+    if rendering and importlib.util.find_spec("pygame") is not None:
+        # Importing the GUI module must not open a window or load fonts, so this is mostly pygame itself
+        results["startup.import_gui_ms"] = import_time_ms(["main"])
+
+
+# --- Engine Benchmarks ---
+def bench_engine(results, duration, sizes):
+    for size in sizes:
+        positions = sample_positions(POSITIONS, size, size)
+
+        def board_moves():
+            for board in positions:
+                for direction in DIRECTIONS:
+                    board.move(direction)
+            return len(positions) * len(DIRECTIONS)
+
+        def board_terminal_checks():
+            for board in positions:
+                board.is_terminal()
+            return len(positions)
+
+        results[f"engine.board.moves_per_sec[{size}x{size}]"] = measure(board_moves, duration)
+        results[f"engine.board.game_over_checks_per_sec[{size}x{size}]"] = measure(board_terminal_checks, duration)
+
+        try:
+            from batch import BatchBoard
+        except ImportError:
+            continue  # NumPy is optional
+        import numpy as np
+
+        batch = BatchBoard.from_boards(positions, np.random.default_rng(0))
+        direction_indices = np.arange(len(positions)) % len(DIRECTIONS)
+
+        def batch_moves():
+            batch.move(direction_indices)
+            return len(positions)
+
+        results[f"batch.moves_per_sec[{size}x{size}]"] = measure(batch_moves, duration)
+
+    # Bitboards only exist for the classic 4x4 board
+    encoded = [bitboard.encode(board) for board in sample_positions(POSITIONS)]
+
+    def bitboard_moves():
+        for bits in encoded:
+            for direction in DIRECTIONS:
+                bitboard.move(bits, direction)
+        return len(encoded) * len(DIRECTIONS)
+
+    def bitboard_terminal_checks():
+        for bits in encoded:
+            bitboard.is_terminal(bits)
+        return len(encoded)
+
+    results["bitboard.moves_per_sec[4x4]"] = measure(bitboard_moves, duration)
+    results["bitboard.game_over_checks_per_sec[4x4]"] = measure(bitboard_terminal_checks, duration)
+
+
+# --- Rendering Benchmarks ---
+def bench_rendering(results, duration, sizes=()):
+    # Frame rates of the GUI drawing code on SDL's dummy video driver (no window is opened)
+    os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")  # The banner would go to stdout, before the report
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    try:
+        import main
+    except ImportError:
+        return  # Pygame is optional for the engine benchmarks
+    positions = sample_positions(POSITIONS // 10)
+    tiles_list = [main.tiles_from_board(board) for board in positions]
+    window = main.init_display()
+
+    def gui_moves():
+        # The GUI path: read the tiles into a board, move, and rebuild the tiles
+        for tiles in tiles_list:
+            for direction in DIRECTIONS:
+                new_board, _, _ = Board.from_tiles(tiles).move(direction)
+                main.tiles_from_board(new_board)
+        return len(tiles_list) * len(DIRECTIONS)
+
+    def full_frames():
+        for tiles in tiles_list:
+            main.draw_elements(window, tiles)
+        return len(tiles_list)
+
+    renderer = main.Renderer(window)
+
+    def idle_frames():
+        for _ in range(100):
+            renderer.draw(tiles_list[0])
+        return 100
+
+    def animation_frames():
+        frames = 0
+        for board in positions[:10]:
+            for direction in DIRECTIONS:
+                final_board, _, moved = board.move(direction)
+                if not moved:
+                    continue
+                animation = main.MoveAnimation(board, direction, final_board)
+                while not animation.update(1000 / main.FPS):
+                    renderer.draw(animation.tiles)
+                    frames += 1
+        return max(frames, 1)
+
+    results["gui.tiles_moves_per_sec[4x4]"] = measure(gui_moves, duration)
+    results["gui.draw_elements_frames_per_sec[4x4]"] = measure(full_frames, duration)
+    results["gui.renderer_idle_frames_per_sec[4x4]"] = measure(idle_frames, duration)
+    results["gui.renderer_animation_frames_per_sec[4x4]"] = measure(animation_frames, duration)
+
+    # Larger boards resize the window and scale the cells, so each size is measured separately
+    try:
+        for size in sizes:
+            if size == 4:
+                continue
+            window = main.set_board_size(size, size)
+            size_tiles = [main.tiles_from_board(board) for board in sample_positions(POSITIONS // 10, size, size)]
+
+            def size_frames():
+                for tiles in size_tiles:
+                    main.draw_elements(window, tiles)
+                return len(size_tiles)
+
+            results[f"gui.draw_elements_frames_per_sec[{size}x{size}]"] = measure(size_frames, duration)
+    finally:
+        main.set_board_size(4, 4)
+
+
+# --- Reporting ---
+def run_benchmarks(duration=DEFAULT_DURATION, sizes=DEFAULT_SIZES, rendering=True):
+    results = {}
+    bench_startup(results, rendering)
+    bench_engine(results, duration, sizes)
+    if rendering:
+        bench_rendering(results, duration, sizes)
+    return {
+        "commit": commit_hash(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "duration": duration,
+        "results": {name: round(value, 1) for name, value in sorted(results.items())},
+    }
+
+
+def compare(report, baseline, threshold):
+    # Return a list of (name, baseline, current, change) for metrics slower than the threshold allows
+    regressions = []
+    for name, previous in baseline.get("results", {}).items():
+        current = report["results"].get(name)
+        if current is None or not previous or not current:
+            continue
+        # Rates regress when they drop, timings (*_ms) when they grow
+        change = previous / current - 1 if name.endswith("_ms") else current / previous - 1
+        if change < -threshold:
+            regressions.append((name, previous, current, change))
+    return regressions
+
+
+# --- Command Line ---
+def add_arguments(parser):
+    parser.add_argument("--duration", type=float, default=DEFAULT_DURATION, help="seconds per measurement")
+    parser.add_argument(
+        "--sizes", type=int, nargs="+", default=list(DEFAULT_SIZES), help="board sizes for the engine benchmarks"
+    )
+    parser.add_argument("--no-render", action="store_true", help="skip the pygame rendering benchmarks")
+    parser.add_argument("--output", metavar="FILE", default=None, help="also write the JSON report to FILE")
+    parser.add_argument("--baseline", metavar="FILE", default=None, help="JSON report to compare against")
+    parser.add_argument(
+        "--import-budget",
+        type=float,
+        default=IMPORT_BUDGET_MS,
+        metavar="MS",
+        help="fail when importing the game logic takes longer than this",
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=DEFAULT_THRESHOLD,
+        help="fail when a metric is this fraction slower than the baseline",
+    )
+    parser.set_defaults(run=run)
+
+
+def run(args):
+    report = run_benchmarks(args.duration, args.sizes, rendering=not args.no_render)
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output is not None:
+        with open(args.output, "w") as file:
+            file.write(output + "\n")
+
+    failed = False
+    import_ms = report["results"]["startup.import_logic_ms"]
+    if import_ms > args.import_budget:
+        print(
+            f"SLOW IMPORT {', '.join(LOGIC_MODULES)}: {import_ms:.1f} ms > {args.import_budget:g} ms", file=sys.stderr
+        )
+        failed = True
+
+    if args.baseline is not None:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+        regressions = compare(report, baseline, args.threshold)
+        for name, previous, current, change in regressions:
+            print(f"REGRESSION {name}: {previous:,.1f} -> {current:,.1f} ({change:+.1%})", file=sys.stderr)
+        failed = failed or bool(regressions)
+    if failed:
+        sys.exit(1)
@@ -0,0 +1,142 @@
+import random
+
+from engine import Board, spawn_value
+from tables import CELL_MASK, MAX_EXPONENT, ROW_MASK, SIZE, get_tables
+
+# --- Bitboard Layout ---
+# A 4x4 board packed into one 64-bit int: each cell holds the log2 exponent of its tile in 4 bits
+# (0 marks an empty cell), cell (row, col) lives at bits 4 * (row * 4 + col), so every row is a
+# 16-bit chunk with column 0 in the lowest nibble.
+
+# Precomputed row tables, indexed by the 16-bit value of one row and mapped from the shared table file
+# (see tables.py) instead of being rebuilt by every process. They are loaded by the first move, so tools
+# that import this module without playing on a bitboard never open or build the file.
+ROW_LEFT = None  # Row after sliding towards column 0
+ROW_RIGHT = None  # Row after sliding towards column 3
+ROW_SCORE = None  # Score gained by the move (identical for both directions)
+
+
+def load_tables():
+    global ROW_LEFT, ROW_RIGHT, ROW_SCORE
+    tables = get_tables()
+    ROW_LEFT, ROW_RIGHT, ROW_SCORE = tables.left, tables.right, tables.score
+
+
+# --- Conversion ---
+def encode(board):
+    # Pack an engine Board into a bitboard
+    if (board.rows, board.cols) != (SIZE, SIZE):
+        raise ValueError(f"Bitboards only support {SIZE}x{SIZE} boards, got {board.rows}x{board.cols}")
+    bits = 0
+    for index, value in enumerate(board.cells):
+        if value:
+            exponent = value.bit_length() - 1
+            if exponent > MAX_EXPONENT:
+                raise ValueError(f"Tile value {value} does not fit in a bitboard")
+            bits |= exponent << (4 * index)
+    return bits
+
+
+def decode(bits):
+    # Unpack a bitboard into an engine Board
+    cells = []
+    for index in range(SIZE * SIZE):
+        exponent = (bits >> (4 * index)) & CELL_MASK
+        cells.append(1 << exponent if exponent else 0)
+    return Board(cells, SIZE, SIZE)
+
+
+def from_tiles(tiles):
+    # Pack the GUI tiles dictionary into a bitboard
+    return encode(Board.from_tiles(tiles, SIZE, SIZE))
+
+
+def to_tiles(bits, tile_class):
+    # Build a GUI tiles dictionary, creating each tile with tile_class(value, row, col)
+    tiles = {}
+    for index in range(SIZE * SIZE):
+        exponent = (bits >> (4 * index)) & CELL_MASK
+        if exponent:
+            row, col = divmod(index, SIZE)
+            tiles[(row, col)] = tile_class(1 << exponent, row, col)
+    return tiles
+
+
+# --- Board Operations ---
+def transpose(bits):
+    # Swap rows and columns, so vertical moves can reuse the row tables
+    a1 = bits & 0xF0F00F0FF0F00F0F
+    a2 = bits & 0x0000F0F00000F0F0
+    a3 = bits & 0x0F0F00000F0F0000
+    a = a1 | (a2 << 12) | (a3 >> 12)
+    b1 = a & 0xFF00FF0000FF00FF
+    b2 = a & 0x00FF00FF00000000
+    b3 = a & 0x00000000FF00FF00
+    return b1 | (b2 >> 24) | (b3 << 24)
+
+
+def _move_rows(bits, table):
+    # Apply a row table to all four rows, returning the new board and the score gained
+    result = 0
+    score = 0
+    for shift in (0, 16, 32, 48):
+        row = (bits >> shift) & ROW_MASK
+        result |= table[row] << shift
+        score += ROW_SCORE[row]
+    return result, score
+
+
+def move(bits, direction):
+    # Slide the board in the given direction
+    # Returns (new_bits, score_delta, moved) like engine.Board.move
+    if ROW_LEFT is None:
+        load_tables()
+    if direction == "left":
+        result, score = _move_rows(bits, ROW_LEFT)
+    elif direction == "right":
+        result, score = _move_rows(bits, ROW_RIGHT)
+    elif direction == "up":
+        result, score = _move_rows(transpose(bits), ROW_LEFT)
+        result = transpose(result)
+    elif direction == "down":
+        result, score = _move_rows(transpose(bits), ROW_RIGHT)
+        result = transpose(result)
+    else:
+        raise ValueError(f"Invalid direction: {direction!r}")
+    if result == bits:
+        return bits, 0, False
+    return result, score, True
+
+
+def empty_cells(bits):
+    # List the nibble indices of every empty cell
+    return [index for index in range(SIZE * SIZE) if not (bits >> (4 * index)) & CELL_MASK]
+
+
+def count_empty(bits):
+    # Count empty cells by folding each nibble down to a single bit
+    bits |= (bits >> 2) & 0x3333333333333333
+    bits |= bits >> 1
+    bits = ~bits & 0x1111111111111111
+    return bin(bits).count("1")
+
+
+def max_exponent(bits):
+    return max((bits >> (4 * index)) & CELL_MASK for index in range(SIZE * SIZE))
+
+
+def spawn(bits, rng=random):
+    # Place a random tile in a random empty cell
+    # Returns (new_bits, (row, col, value)), or (bits, None) when the board is full
+    empty = empty_cells(bits)
+    if not empty:
+        return bits, None
+    index = rng.choice(empty)
+    value = spawn_value(rng)
+    row, col = divmod(index, SIZE)
+    return bits | ((value.bit_length() - 1) << (4 * index)), (row, col, value)
+
+
+def is_terminal(bits):
+    # The game is over when no direction changes the board
+    return all(not move(bits, direction)[2] for direction in ("left", "right", "up", "down"))
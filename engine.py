@@ -0,0 +1,508 @@
+import random
+from bisect import bisect_right
+
+# --- Engine Constants ---
+ROWS = 4
+COLS = 4
+DIRECTIONS = ("up", "down", "left", "right")
+WINNING_VALUE = 2048
+SPAWN_VALUES = [2, 4]  # Values a new tile can take after a move
+# Integer weights of SPAWN_VALUES; "classic" is the 90/10 split of the original game
+SPAWN_DISTRIBUTIONS = {"uniform": (1, 1), "classic": (9, 1)}
+DEFAULT_SPAWN = "uniform"
+START_TILES = 2  # Number of tiles placed on a fresh board
+START_VALUE = 2  # Value of the tiles placed on a fresh board
+MIN_SIZE = 2  # Smallest supported number of rows or columns
+MAX_SIZE = 16  # Largest supported number of rows or columns
+
+# Cache of the cell indices making up every line, keyed by board size and direction
+_LINES = {}
+
+
+# --- Size Helpers ---
+def check_size(rows, cols):
+    if not (MIN_SIZE <= rows <= MAX_SIZE and MIN_SIZE <= cols <= MAX_SIZE):
+        raise ValueError(f"Board size must be between {MIN_SIZE} and {MAX_SIZE} in each direction, got {rows}x{cols}")
+
+
+def parse_size(text):
+    # Parse a size like "4x4" or "8" into (rows, cols)
+    try:
+        rows, _, cols = text.lower().partition("x")
+        rows, cols = int(rows), int(cols or rows)
+    except ValueError:
+        raise ValueError(f"Invalid board size: {text!r} (expected RxC, e.g. 4x4)") from None
+    check_size(rows, cols)
+    return rows, cols
+
+
+# --- Random Numbers ---
+def spawn_probabilities(spawn=DEFAULT_SPAWN):
+    # Return [(value, probability)] for a spawn distribution name
+    if spawn not in SPAWN_DISTRIBUTIONS:
+        raise ValueError(f"Unknown spawn distribution: {spawn!r} (expected one of {', '.join(SPAWN_DISTRIBUTIONS)})")
+    weights = SPAWN_DISTRIBUTIONS[spawn]
+    return [(value, weight / sum(weights)) for value, weight in zip(SPAWN_VALUES, weights)]
+
+
+class GameRandom(random.Random):
+    # Per-game RNG that also carries the spawn distribution, so every engine call taking an rng draws
+    # tile values the same way; seeding it makes a whole game reproducible
+    # The uniform distribution draws exactly like rng.choice(SPAWN_VALUES), so seeds keep their games
+    def __init__(self, seed=None, spawn=DEFAULT_SPAWN):
+        super().__init__(seed)
+        spawn_probabilities(spawn)  # Validate the name
+        self.spawn = spawn
+        self._cumulative = []
+        total = 0
+        for weight in SPAWN_DISTRIBUTIONS[spawn]:
+            total += weight
+            self._cumulative.append(total)
+
+    def __reduce__(self):
+        return self.__class__, (None, self.spawn), self.getstate()
+
+    def spawn_value(self):
+        return SPAWN_VALUES[bisect_right(self._cumulative, self.randrange(self._cumulative[-1]))]
+
+
+def spawn_value(rng):
+    # Draw the value of a new tile; a GameRandom uses its own distribution, any other RNG is uniform
+    draw = getattr(rng, "spawn_value", None)
+    return draw() if draw is not None else rng.choice(SPAWN_VALUES)
+
+
+# --- Line Helpers ---
+def get_lines(rows, cols, direction):
+    # Return the cell indices of every line, ordered so index 0 is the edge tiles slide towards
+    key = (rows, cols, direction)
+    lines = _LINES.get(key)
+    if lines is None:
+        if direction == "left":
+            lines = [[row * cols + col for col in range(cols)] for row in range(rows)]
+        elif direction == "right":
+            lines = [[row * cols + col for col in reversed(range(cols))] for row in range(rows)]
+        elif direction == "up":
+            lines = [[row * cols + col for row in range(rows)] for col in range(cols)]
+        elif direction == "down":
+            lines = [[row * cols + col for row in reversed(range(rows))] for col in range(cols)]
+        else:
+            raise ValueError(f"Invalid direction: {direction!r}")
+        _LINES[key] = lines
+    return lines
+
+
+def merge_line(values):
+    # Slide the non-empty values towards index 0, merging equal neighbours at most once per move
+    # Returns the new line and the score gained from merges
+    tiles = [value for value in values if value]
+    merged = []
+    score = 0
+    index = 0
+    while index < len(tiles):
+        value = tiles[index]
+        if index + 1 < len(tiles) and tiles[index + 1] == value:
+            # The tile behind merges into this one, matching the merged_with rule in the GUI
+            merged.append(value * 2)
+            score += value * 2
+            index += 2
+        else:
+            merged.append(value)
+            index += 1
+    merged.extend([0] * (len(values) - len(merged)))
+    return merged, score
+
+
+def merge_line_targets(values):
+    # Same as merge_line, but returns the target position of every non-empty source position
+    targets = {}
+    target = -1
+    open_value = None  # Value at the current target that can still accept a merge
+    for position, value in enumerate(values):
+        if not value:
+            continue
+        if value == open_value:
+            # Merge into the tile already sitting at the current target
+            targets[position] = target
+            open_value = None
+        else:
+            target += 1
+            targets[position] = target
+            open_value = value
+    return targets
+
+
+# --- Board ---
+class Board:
+    # Immutable grid of tile values stored row-major, 0 marks an empty cell
+    __slots__ = ("rows", "cols", "cells")
+
+    def __init__(self, cells=None, rows=ROWS, cols=COLS):
+        self.rows = rows
+        self.cols = cols
+        self.cells = tuple(cells) if cells is not None else (0,) * (rows * cols)
+        if len(self.cells) != rows * cols:
+            raise ValueError(f"Expected {rows * cols} cells, got {len(self.cells)}")
+
+    @classmethod
+    def from_rows(cls, grid):
+        # Build a board from a list of rows of values
+        return cls([value for row in grid for value in row], len(grid), len(grid[0]))
+
+    @classmethod
+    def from_tiles(cls, tiles, rows=ROWS, cols=COLS):
+        # Build a board from any mapping of objects with row, col and value attributes (e.g. the GUI tiles)
+        cells = [0] * (rows * cols)
+        for tile in tiles.values():
+            cells[tile.row * cols + tile.col] = tile.value
+        return cls(cells, rows, cols)
+
+    @classmethod
+    def new_game(cls, rng=random, rows=ROWS, cols=COLS):
+        # Create the starting position with START_TILES tiles of START_VALUE
+        cells = [0] * (rows * cols)
+        for index in rng.sample(range(rows * cols), START_TILES):
+            cells[index] = START_VALUE
+        return cls(cells, rows, cols)
+
+    def __eq__(self, other):
+        return isinstance(other, Board) and (self.rows, self.cols, self.cells) == (other.rows, other.cols, other.cells)
+
+    def __hash__(self):
+        return hash((self.rows, self.cols, self.cells))
+
+    def __repr__(self):
+        return f"Board({self.to_rows()!r})"
+
+    def __str__(self):
+        width = len(str(self.max_tile())) if self.max_tile() else 1
+        return "\n".join(" ".join(str(value or ".").rjust(width) for value in row) for row in self.to_rows())
+
+    def to_rows(self):
+        # Return the board as a list of rows of values
+        return [list(self.cells[row * self.cols : (row + 1) * self.cols]) for row in range(self.rows)]
+
+    def get(self, row, col):
+        return self.cells[row * self.cols + col]
+
+    def place(self, row, col, value):
+        # Return a new board with the given cell set to value
+        cells = list(self.cells)
+        cells[row * self.cols + col] = value
+        return Board(cells, self.rows, self.cols)
+
+    def empty_cells(self):
+        # List the (row, col) of every empty cell in row-major order
+        return [divmod(index, self.cols) for index, value in enumerate(self.cells) if not value]
+
+    def is_full(self):
+        return 0 not in self.cells
+
+    def max_tile(self):
+        return max(self.cells)
+
+    def has_won(self):
+        return WINNING_VALUE in self.cells
+
+    def can_merge(self):
+        # Check whether any two orthogonally adjacent tiles share a value
+        cells, cols = self.cells, self.cols
+        for row in range(self.rows):
+            base = row * cols
+            for col in range(cols):
+                value = cells[base + col]
+                if not value:
+                    continue
+                if col < cols - 1 and cells[base + col + 1] == value:
+                    return True
+                if row < self.rows - 1 and cells[base + cols + col] == value:
+                    return True
+        return False
+
+    def is_terminal(self):
+        # The game is over when the board is full and no merge is possible
+        return self.is_full() and not self.can_merge()
+
+    def move(self, direction):
+        # Slide every line in the given direction
+        # Returns (new_board, score_delta, moved) with the same semantics as the GUI move
+        cells = list(self.cells)
+        score = 0
+        for line in get_lines(self.rows, self.cols, direction):
+            values = [cells[index] for index in line]
+            merged, line_score = merge_line(values)
+            if merged != values:
+                score += line_score
+                for index, value in zip(line, merged):
+                    cells[index] = value
+        moved = cells != list(self.cells)
+        return (Board(cells, self.rows, self.cols) if moved else self), score, moved
+
+    def move_targets(self, direction):
+        # Map each tile's (row, col) to the (row, col) it slides to, used to drive the GUI animation
+        targets = {}
+        for line in get_lines(self.rows, self.cols, direction):
+            line_targets = merge_line_targets([self.cells[index] for index in line])
+            for position, target in line_targets.items():
+                targets[divmod(line[position], self.cols)] = divmod(line[target], self.cols)
+        return targets
+
+    def spawn(self, rng=random):
+        # Place a random tile in a random empty cell
+        # Returns (new_board, (row, col, value)), or (self, None) when the board is full
+        empty = self.empty_cells()
+        if not empty:
+            return self, None
+        row, col = rng.choice(empty)
+        value = spawn_value(rng)
+        return self.place(row, col, value), (row, col, value)
+
+
+# --- Grid ---
+class Grid:
+    # Mutable board that keeps the occupied cells of every row and column, an indexable list of empty
+    # cells and a running count of adjacent equal pairs, so a move only touches the occupied tiles and
+    # spawning and game-over checks are O(1); used by Game for every board size up to MAX_SIZE
+    def __init__(self, rows=ROWS, cols=COLS):
+        self.rows = rows
+        self.cols = cols
+        self.values = {}  # (row, col) -> value of every occupied cell
+        self.row_cells = [set() for _ in range(rows)]  # Occupied columns of each row
+        self.col_cells = [set() for _ in range(cols)]  # Occupied rows of each column
+        self.empty = [(row, col) for row in range(rows) for col in range(cols)]  # Empty cells, in no order
+        self.empty_index = {cell: index for index, cell in enumerate(self.empty)}  # Cell -> index in empty
+        self.equal_pairs = 0  # Orthogonally adjacent tile pairs with the same value
+        self.journal = None  # While a list, place() logs (cell, old_value) so make/unmake can revert
+
+    @classmethod
+    def from_board(cls, board, empty_order=None):
+        # empty_order is a saved empty_order(), so the rebuilt grid draws the same spawn cells as the saved one
+        grid = cls(board.rows, board.cols)
+        for index, value in enumerate(board.cells):
+            if value:
+                grid.place(*divmod(index, board.cols), value)
+        if empty_order is not None:
+            grid.empty = [divmod(index, board.cols) for index in empty_order]
+            grid.empty_index = {cell: index for index, cell in enumerate(grid.empty)}
+        return grid
+
+    def to_board(self):
+        cells = [0] * (self.rows * self.cols)
+        for (row, col), value in self.values.items():
+            cells[row * self.cols + col] = value
+        return Board(cells, self.rows, self.cols)
+
+    def __len__(self):
+        return len(self.values)
+
+    def get(self, row, col):
+        return self.values.get((row, col), 0)
+
+    def place(self, row, col, value):
+        # Set a cell to value, or clear it when value is 0
+        cell = (row, col)
+        old_value = self.values.get(cell, 0)
+        if value == old_value:
+            return
+        if self.journal is not None:
+            self.journal.append((cell, old_value))
+        # Only the four neighbours of this cell can gain or lose an equal pair
+        values = self.values
+        for neighbour in ((row - 1, col), (row + 1, col), (row, col - 1), (row, col + 1)):
+            neighbour_value = values.get(neighbour)
+            if neighbour_value is not None:
+                self.equal_pairs += (neighbour_value == value) - (neighbour_value == old_value)
+
+        if not value:
+            del values[cell]
+            self.row_cells[row].discard(col)
+            self.col_cells[col].discard(row)
+            self.empty_index[cell] = len(self.empty)
+            self.empty.append(cell)
+            return
+        values[cell] = value
+        if not old_value:
+            self.row_cells[row].add(col)
+            self.col_cells[col].add(row)
+            # Swap the last empty cell into this one's slot, so removal is O(1)
+            index = self.empty_index.pop(cell)
+            last = self.empty.pop()
+            if last != cell:
+                self.empty[index] = last
+                self.empty_index[last] = index
+
+    def empty_count(self):
+        return len(self.empty)
+
+    def empty_order(self):
+        # The order of the empty-cell list as one byte per cell index; it depends on the moves played, and
+        # random_empty_cell draws from it, so restoring a position must restore it too
+        return bytes(row * self.cols + col for row, col in self.empty)
+
+    def random_empty_cell(self, rng=random):
+        # Pick an empty cell uniformly in O(1), or None when the grid is full
+        if not self.empty:
+            return None
+        return self.empty[rng.randrange(len(self.empty))]
+
+    def is_full(self):
+        return not self.empty
+
+    def max_tile(self):
+        return max(self.values.values(), default=0)
+
+    def has_won(self):
+        return WINNING_VALUE in self.values.values()
+
+    def can_merge(self):
+        # Check whether any two orthogonally adjacent tiles share a value
+        return self.equal_pairs > 0
+
+    def is_terminal(self):
+        # O(1): no empty cell to slide into and no equal neighbours to merge
+        return not self.empty and not self.equal_pairs
+
+    def move(self, direction):
+        # Slide the tiles in place, visiting only occupied cells; returns (score_delta, moved)
+        if direction in ("left", "right"):
+            horizontal, lines, length = True, self.row_cells, self.cols
+        elif direction in ("up", "down"):
+            horizontal, lines, length = False, self.col_cells, self.rows
+        else:
+            raise ValueError(f"Invalid direction: {direction!r}")
+        towards_end = direction in ("right", "down")
+
+        score = 0
+        moved = False
+        for line, occupied in enumerate(lines):
+            if not occupied:
+                continue
+            positions = sorted(occupied, reverse=towards_end)
+            cells = [(line, position) if horizontal else (position, line) for position in positions]
+            values = [self.values[cell] for cell in cells]
+            merged, line_score = merge_line(values)
+            merged = merged[: len(merged) - merged.count(0)]
+            targets = range(length - 1, length - 1 - len(merged), -1) if towards_end else range(len(merged))
+            if merged == values and list(targets) == positions:
+                continue  # This line is already packed and has nothing to merge
+
+            moved = True
+            score += line_score
+            for row, col in cells:
+                self.place(row, col, 0)
+            for position, value in zip(targets, merged):
+                if horizontal:
+                    self.place(line, position, value)
+                else:
+                    self.place(position, line, value)
+        return score, moved
+
+    def make(self, direction):
+        # Apply a move and return (score_delta, moved, changes); unmake(changes) restores the grid,
+        # which lets search code walk the tree on one grid instead of copying boards
+        self.journal = changes = []
+        try:
+            score, moved = self.move(direction)
+        finally:
+            self.journal = None
+        return score, moved, changes
+
+    def unmake(self, changes):
+        # Revert a make(), or any list of (cell, old_value) changes, newest first
+        for (row, col), old_value in reversed(changes):
+            self.place(row, col, old_value)
+
+    def spawn(self, rng=random):
+        # Place a random tile in a random empty cell, returning (row, col, value) or None when full
+        cell = self.random_empty_cell(rng)
+        if cell is None:
+            return None
+        row, col = cell
+        value = spawn_value(rng)
+        self.place(row, col, value)
+        return row, col, value
+
+
+def skip_spawn(rng, empty_count):
+    # Advance rng past the draws of one Grid.spawn on a grid with empty_count empty cells, without a grid
+    rng.randrange(empty_count)
+    spawn_value(rng)
+
+
+# --- Game Rules ---
+def apply_rules(position, moved, has_kept_playing, spawn):
+    # The rules after one slide of position, shared by Game (on its Grid) and the server sessions (on an
+    # immutable Board): a slide that moved nothing only loses when the position is stuck; reaching the
+    # winning tile shows the win screen unless the player chose to keep playing; any other move spawns a
+    # tile through spawn(position) -> (position, (row, col, value)) and loses if that leaves the position stuck
+    # Returns (position, state, spawned tile or None)
+    if not moved:
+        return position, "lost" if position.is_terminal() else "playing", None
+    if not has_kept_playing and position.has_won():
+        return position, "won", None
+    position, spawned = spawn(position)
+    return position, "lost" if position.is_terminal() else "playing", spawned
+
+
+# --- Game ---
+class Game:
+    # Headless game session mirroring the GUI rules, including the win screen and keep-playing option
+    def __init__(self, rng=None, rows=ROWS, cols=COLS):
+        check_size(rows, cols)
+        self.rng = rng if rng is not None else GameRandom()
+        self.rows = rows
+        self.cols = cols
+        self.restart()
+
+    def restart(self):
+        # Start a fresh game on the same RNG
+        self.board = Board.new_game(self.rng, self.rows, self.cols)
+        self.score = 0
+        self.moves = 0
+        self.state = "playing"  # Possible states: "playing", "won", "lost"
+        self.has_kept_playing = False
+        self.last_spawn = None
+
+    @property
+    def board(self):
+        # Immutable snapshot of the grid, built on demand and cached until the next move
+        if self._board is None:
+            self._board = self.grid.to_board()
+        return self._board
+
+    @board.setter
+    def board(self, board):
+        self.set_board(board)
+
+    def set_board(self, board, empty_order=None):
+        # Replace the position; pass a saved grid.empty_order() to keep drawing the same spawns
+        self.grid = Grid.from_board(board, empty_order)
+        self._board = board
+
+    def keep_playing(self):
+        # Continue after reaching the winning tile
+        if self.state == "won":
+            self.state = "playing"
+            self.has_kept_playing = True
+
+    def move(self, direction):
+        # Apply one move, then either show the win or spawn a new tile
+        # Returns whether any tile moved or merged
+        if self.state != "playing":
+            return False
+        score_delta, moved = self.grid.move(direction)
+        # The grid tracks empty cells and equal pairs, so the rules' game-over checks are O(1)
+        _, self.state, spawned = apply_rules(self.grid, moved, self.has_kept_playing, self._spawn)
+        if not moved:
+            return False
+        self._board = None
+        self.score += score_delta
+        self.moves += 1
+        self.last_spawn = spawned
+        return True
+
+    def _spawn(self, grid):
+        return grid, grid.spawn(self.rng)
+
+    def is_over(self):
+        return self.state == "lost"
@@ -0,0 +1,263 @@
+import argparse
+import multiprocessing
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from batch import BatchBoard
+from engine import COLS, DIRECTIONS, ROWS
+
+# --- Environment Constants ---
+ENCODINGS = ("onehot", "exponent", "flat")
+NUM_CLASSES = 16  # One-hot channels: empty plus exponents 1..15
+CLASSES = np.arange(NUM_CLASSES, dtype=np.uint8).reshape(1, NUM_CLASSES, 1, 1)
+ACTIONS = DIRECTIONS  # Action i is DIRECTIONS[i]: 0 up, 1 down, 2 left, 3 right
+
+
+# --- Observation Encoding ---
+def observation_spec(encoding, rows=ROWS, cols=COLS):
+    # Return (shape, dtype) of the observation of a single environment
+    if encoding == "onehot":
+        return (NUM_CLASSES, rows, cols), np.uint8
+    if encoding == "exponent":
+        return (rows, cols), np.uint8
+    if encoding == "flat":
+        return (rows * cols,), np.float32
+    raise ValueError(f"Unknown encoding: {encoding!r}")
+
+
+def encode_observations(exponents, encoding, out):
+    # Write the observations of an (N, rows, cols) exponent array straight into out
+    if encoding == "onehot":
+        np.equal(exponents[:, None, :, :], CLASSES, out=out, casting="unsafe")
+    elif encoding == "exponent":
+        out[...] = exponents
+    else:
+        out[...] = exponents.reshape(len(exponents), -1)
+    return out
+
+
+# --- Environment Core ---
+class _EnvCore:
+    # Steps a slice of games and writes the results into caller-owned arrays (plain or shared memory)
+    def __init__(self, count, rows, cols, encoding, observations, rewards, dones, final_scores):
+        self.count = count
+        self.rows = rows
+        self.cols = cols
+        self.encoding = encoding
+        self.observations = observations
+        self.rewards = rewards
+        self.dones = dones
+        self.final_scores = final_scores
+        self.scores = np.zeros(count, dtype=np.int64)
+        self.batch = None
+
+    def reset(self, seed):
+        self.batch = BatchBoard.new(self.count, self.rows, self.cols, np.random.default_rng(seed))
+        self.scores[:] = 0
+        self.rewards[:] = 0
+        self.dones[:] = False
+        self.final_scores[:] = 0
+        encode_observations(self.batch.exponents, self.encoding, self.observations)
+
+    def step(self, actions):
+        _, rewards, _, dones = self.batch.step(actions)
+        self.scores += rewards
+        self.rewards[:] = rewards
+        self.dones[:] = dones
+        self.final_scores[:] = np.where(dones, self.scores, 0)
+        if dones.any():
+            # Auto-reset finished games, like pressing SPACE on the game over screen
+            self.batch.reset(dones)
+            self.scores[dones] = 0
+        encode_observations(self.batch.exponents, self.encoding, self.observations)
+
+
+# --- Synchronous Vector Environment ---
+class VectorEnv:
+    # num_envs games stepped together in this process
+    # step returns (observations, rewards, dones, infos); infos["final_score"] holds the score of finished games
+    def __init__(self, num_envs, rows=ROWS, cols=COLS, encoding="onehot"):
+        shape, dtype = observation_spec(encoding, rows, cols)
+        self.num_envs = num_envs
+        self.encoding = encoding
+        self.observations = np.zeros((num_envs, *shape), dtype=dtype)
+        self.rewards = np.zeros(num_envs, dtype=np.int64)
+        self.dones = np.zeros(num_envs, dtype=bool)
+        self.final_scores = np.zeros(num_envs, dtype=np.int64)
+        self._core = _EnvCore(
+            num_envs, rows, cols, encoding, self.observations, self.rewards, self.dones, self.final_scores
+        )
+
+    def reset(self, seed=None):
+        self._core.reset(seed)
+        return self.observations
+
+    def step(self, actions):
+        self._core.step(np.asarray(actions))
+        return self.observations, self.rewards, self.dones, {"final_score": self.final_scores}
+
+    def close(self):
+        pass
+
+
+# --- Subprocess Vector Environment ---
+class _SharedArray:
+    # A numpy array backed by a named shared memory block
+    def __init__(self, shape, dtype, name=None):
+        size = max(1, int(np.prod(shape)) * np.dtype(dtype).itemsize)
+        self.memory = shared_memory.SharedMemory(name=name, create=name is None, size=size)
+        self.array = np.ndarray(shape, dtype=dtype, buffer=self.memory.buf)
+        self.spec = (shape, dtype, self.memory.name)
+
+    def close(self, unlink=False):
+        del self.array
+        self.memory.close()
+        if unlink:
+            self.memory.unlink()
+
+
+def _worker(connection, start, stop, rows, cols, encoding, specs):
+    # Attach to the shared buffers and step the games in [start, stop) on command
+    shared = {key: _SharedArray(shape, dtype, name) for key, (shape, dtype, name) in specs.items()}
+    views = {key: value.array[start:stop] for key, value in shared.items()}
+    core = _EnvCore(
+        stop - start,
+        rows,
+        cols,
+        encoding,
+        views["observations"],
+        views["rewards"],
+        views["dones"],
+        views["final_scores"],
+    )
+    try:
+        while True:
+            command, argument = connection.recv()
+            if command == "step":
+                core.step(views["actions"])
+            elif command == "reset":
+                core.reset(argument)
+            elif command == "close":
+                break
+            connection.send(None)
+    finally:
+        del core, views
+        for value in shared.values():
+            value.close()
+        connection.close()
+
+
+class SubprocVectorEnv:
+    # num_envs games split across worker processes
+    # Actions, observations, rewards and dones live in shared memory; the pipes only carry short commands
+    def __init__(self, num_envs, workers=None, rows=ROWS, cols=COLS, encoding="onehot"):
+        workers = min(workers or multiprocessing.cpu_count(), num_envs)
+        shape, dtype = observation_spec(encoding, rows, cols)
+        self.num_envs = num_envs
+        self.encoding = encoding
+        self._shared = {
+            "observations": _SharedArray((num_envs, *shape), dtype),
+            "rewards": _SharedArray((num_envs,), np.int64),
+            "dones": _SharedArray((num_envs,), np.bool_),
+            "final_scores": _SharedArray((num_envs,), np.int64),
+            "actions": _SharedArray((num_envs,), np.int64),
+        }
+        self.observations = self._shared["observations"].array
+        self.rewards = self._shared["rewards"].array
+        self.dones = self._shared["dones"].array
+        self.final_scores = self._shared["final_scores"].array
+        self._actions = self._shared["actions"].array
+        specs = {key: value.spec for key, value in self._shared.items()}
+
+        bounds = np.linspace(0, num_envs, workers + 1).astype(int)
+        self._connections = []
+        self._processes = []
+        for start, stop in zip(bounds[:-1], bounds[1:]):
+            parent, child = multiprocessing.Pipe()
+            process = multiprocessing.Process(
+                target=_worker, args=(child, int(start), int(stop), rows, cols, encoding, specs), daemon=True
+            )
+            process.start()
+            child.close()
+            self._connections.append(parent)
+            self._processes.append(process)
+        self._closed = False
+
+    def _broadcast(self, command, arguments):
+        for connection, argument in zip(self._connections, arguments):
+            connection.send((command, argument))
+        for connection in self._connections:
+            connection.recv()
+
+    def reset(self, seed=None):
+        # Every worker gets an independent stream derived from the seed
+        seeds = np.random.SeedSequence(seed).spawn(len(self._connections))
+        self._broadcast("reset", seeds)
+        return self.observations
+
+    def step(self, actions):
+        self._actions[:] = actions
+        self._broadcast("step", [None] * len(self._connections))
+        return self.observations, self.rewards, self.dones, {"final_score": self.final_scores}
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        for connection in self._connections:
+            connection.send(("close", None))
+            connection.close()
+        for process in self._processes:
+            process.join()
+        del self.observations, self.rewards, self.dones, self.final_scores, self._actions
+        for value in self._shared.values():
+            value.close(unlink=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def make_env(num_envs, workers=0, rows=ROWS, cols=COLS, encoding="onehot"):
+    # workers=0 steps everything in this process, otherwise games are split across subprocesses
+    if workers:
+        return SubprocVectorEnv(num_envs, workers, rows, cols, encoding)
+    return VectorEnv(num_envs, rows, cols, encoding)
+
+
+# --- Benchmark ---
+def benchmark(env, steps, seed=0):
+    # Step env with random actions and return environment steps per second
+    rng = np.random.default_rng(seed)
+    env.reset(seed)
+    actions = rng.integers(len(ACTIONS), size=(steps, env.num_envs))
+    start = time.perf_counter()
+    for step_actions in actions:
+        env.step(step_actions)
+    elapsed = time.perf_counter() - start
+    return steps * env.num_envs / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the vectorized 2048 environment")
+    parser.add_argument("--envs", type=int, default=256, help="number of parallel games")
+    parser.add_argument("--workers", type=int, default=0, help="subprocess workers (0 runs in this process)")
+    parser.add_argument("--steps", type=int, default=1000, help="vector steps to run")
+    parser.add_argument("--encoding", choices=ENCODINGS, default="onehot")
+    parser.add_argument("--size", type=int, default=ROWS, help="board size")
+    args = parser.parse_args()
+
+    env = make_env(args.envs, args.workers, args.size, args.size, args.encoding)
+    try:
+        rate = benchmark(env, args.steps)
+    finally:
+        env.close()
+    print(f"envs={args.envs} workers={args.workers} encoding={args.encoding} env-steps/sec={rate:,.0f}")
+
+
+if __name__ == "__main__":
+    main()
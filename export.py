@@ -0,0 +1,389 @@
+import multiprocessing
+import os
+import shutil
+import stat
+import struct
+import sys
+import tempfile
+import time
+import zlib
+from itertools import islice
+
+from replay import ReplayError, ReplayReader
+
+# --- Export Constants ---
+DEFAULT_FPS = 60
+DEFAULT_CHUNK_MOVES = 50  # Moves rendered per worker task
+FORMATS = ("png", "raw")
+FRAME_NAME = "frame-{:06d}.png"  # PNG frames are numbered from 0 across the whole export
+# zlib level of the PNG frames: the flat tile colours compress well even at level 1, which encodes
+# about three times faster than pygame.image.save; the encoder would be re-run by ffmpeg anyway
+PNG_COMPRESSION = 1
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+
+def load_gui():
+    # Import the GUI renderer on SDL's dummy video driver; frames are drawn into offscreen surfaces,
+    # so no window is opened, and pygame's banner is hidden so it cannot end up in a raw stream on stdout
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+    import main
+
+    return main
+
+
+# --- Timeline ---
+# Frames follow the GUI replay playback at a fixed timestep: the first position is held for
+# REPLAY_PAUSE_MS, every move slides at ANIMATION_SPEED and is then held for REPLAY_MOVE_MS, and the
+# last position is held for REPLAY_PAUSE_MS, under the game over overlay if the game was lost
+def hold_frames(hold_ms, frame_ms):
+    return max(1, round(hold_ms / frame_ms))
+
+
+def animation_frames(gui, board, direction, final_board, frame_ms):
+    # Yield the tiles of every frame of one move, ending on the final position with the spawned tile
+    animation = gui.MoveAnimation(board, direction, final_board)
+    while not animation.update(frame_ms):
+        yield animation.tiles
+    yield animation.final_tiles
+
+
+def plan_segments(gui, record, start, end, frame_ms, chunk_moves):
+    # Split moves start..end into segments of chunk_moves moves and count the frames of each, without
+    # drawing anything, so every worker knows the frame number its segment starts at
+    # Returns ([(first frame, start move, end move), ...], total frames)
+    segments = []
+    frame = hold_frames(gui.REPLAY_PAUSE_MS, frame_ms)
+    segment_start, segment_frame = start, 0
+    board, _ = record.board_at(start)
+    move_hold = hold_frames(gui.REPLAY_MOVE_MS, frame_ms) - 1  # The last animation frame is held too
+    for move, (next_board, _, direction, _) in enumerate(islice(record.positions(start), end - start), start):
+        if move - segment_start == chunk_moves:
+            segments.append((segment_frame, segment_start, move))
+            segment_start, segment_frame = move, frame
+        frame += sum(1 for _ in animation_frames(gui, board, direction, next_board, frame_ms)) + move_hold
+        board = next_board
+    segments.append((segment_frame, segment_start, end))
+    return segments, frame + hold_frames(gui.REPLAY_PAUSE_MS, frame_ms)
+
+
+# --- Frame Sinks ---
+def png_chunk(tag, data):
+    return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", zlib.crc32(tag + data))
+
+
+def encode_png(surface, level=PNG_COMPRESSION):
+    # Encode a surface as an 8-bit RGB PNG with no row filters
+    import pygame
+
+    width, height = surface.get_size()
+    pixels = memoryview(pygame.image.tobytes(surface, "RGB"))
+    stride = width * 3
+    # Every row starts with its filter type, 0 (none)
+    rows = b"\x00" + b"\x00".join(pixels[row * stride : (row + 1) * stride] for row in range(height))
+    header = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+    data = zlib.compress(rows, level)
+    return PNG_SIGNATURE + png_chunk(b"IHDR", header) + png_chunk(b"IDAT", data) + png_chunk(b"IEND", b"")
+
+
+class PngSink:
+    # Writes every frame to DIR/frame-NNNNNN.png; held frames are hard links to the first copy
+    def __init__(self, directory):
+        self.directory = directory
+        self.last_path = None
+
+    def write(self, surface, frame):
+        self.last_path = os.path.join(self.directory, FRAME_NAME.format(frame))
+        with open(self.last_path, "wb") as file:
+            file.write(encode_png(surface))
+
+    def repeat(self, surface, frame):
+        path = os.path.join(self.directory, FRAME_NAME.format(frame))
+        try:
+            if os.path.lexists(path):
+                os.unlink(path)
+            os.link(self.last_path, path)
+        except OSError:
+            shutil.copyfile(self.last_path, path)  # File systems without hard links
+
+    def close(self):
+        pass
+
+
+class RawSink:
+    # Writes frames straight from the surface's pixel buffer to a file descriptor, with no copy in Python
+    # Seekable files are written with pwrite at frame * frame_bytes, relative to base_frame, so workers can
+    # fill their part of one preallocated file in any order; pipes are written in order
+    def __init__(self, fd, frame_bytes, base_frame=0, seekable=True, close_fd=True):
+        self.fd = fd
+        self.frame_bytes = frame_bytes
+        self.base_frame = base_frame
+        self.seekable = seekable
+        self.close_fd = close_fd
+
+    def write(self, surface, frame):
+        # The view locks the surface until it is released, so it only lives for this call
+        view = surface.get_view("0")
+        try:
+            if self.seekable:
+                written = os.pwrite(self.fd, view, (frame - self.base_frame) * self.frame_bytes)
+                if written != self.frame_bytes:
+                    raise OSError(f"Short write of frame {frame}")
+            else:
+                write_all(self.fd, memoryview(view))
+        finally:
+            del view
+
+    repeat = write  # A held frame is the same pixels written again, without drawing
+
+    def close(self):
+        if self.close_fd:
+            os.close(self.fd)
+
+
+def write_all(fd, data):
+    while data:
+        data = data[os.write(fd, data) :]
+
+
+def raw_pixel_format(surface):
+    # ffmpeg pix_fmt name of the surface's byte layout, e.g. "bgr0" for little-endian XRGB
+    names = []
+    for index in range(surface.get_bytesize()):
+        shift = 8 * index if sys.byteorder == "little" else 8 * (surface.get_bytesize() - 1 - index)
+        channel = "0"
+        for name, channel_shift, mask in zip("rgba", surface.get_shifts(), surface.get_masks()):
+            if mask and channel_shift == shift:
+                channel = name
+        names.append(channel)
+    return "".join(names)
+
+
+# --- Rendering ---
+def render_segment(task):
+    # Render moves start..end of one game into a sink, including the opening hold for the first segment
+    # and the closing hold for the last; returns the number of frames written
+    path, game_index, (first_frame, start, end), is_first, is_last, frame_ms, sink_spec = task
+    gui = load_gui()
+    with ReplayReader(path) as reader:
+        record = reader[game_index]
+        if (record.rows, record.cols) != (gui.ROWS, gui.COLS):
+            gui.set_board_size(record.rows, record.cols)
+        surface = gui.pygame.Surface((gui.WIDTH, gui.HEIGHT))
+        renderer = gui.Renderer(surface, present=False)
+        sink = open_sink(sink_spec, surface)
+        frame = first_frame
+        board, _ = record.board_at(start)
+        try:
+            if is_first:
+                renderer.draw(gui.tiles_from_board(board))
+                sink.write(surface, frame)
+                frame += 1
+                for _ in range(hold_frames(gui.REPLAY_PAUSE_MS, frame_ms) - 1):
+                    sink.repeat(surface, frame)
+                    frame += 1
+            for next_board, _, direction, _ in islice(record.positions(start), end - start):
+                for tiles in animation_frames(gui, board, direction, next_board, frame_ms):
+                    renderer.draw(tiles)
+                    sink.write(surface, frame)
+                    frame += 1
+                for _ in range(hold_frames(gui.REPLAY_MOVE_MS, frame_ms) - 1):
+                    sink.repeat(surface, frame)
+                    frame += 1
+                board = next_board
+            if is_last:
+                renderer.draw(gui.tiles_from_board(board), "lost" if board.is_terminal() else None)
+                sink.write(surface, frame)
+                frame += 1
+                for _ in range(hold_frames(gui.REPLAY_PAUSE_MS, frame_ms) - 1):
+                    sink.repeat(surface, frame)
+                    frame += 1
+        finally:
+            sink.close()
+    return frame - first_frame
+
+
+def open_sink(sink_spec, surface):
+    # Sinks are described by plain tuples, so tasks can be sent to worker processes
+    kind = sink_spec[0]
+    if kind == "png":
+        return PngSink(sink_spec[1])
+    frame_bytes = surface.get_pitch() * surface.get_height()
+    if kind == "file":
+        # A preallocated file (the output or a segment of it) written at frame offsets from base_frame
+        _, path, base_frame = sink_spec
+        return RawSink(os.open(path, os.O_WRONLY), frame_bytes, base_frame)
+    # An already open pipe, written in order by the only renderer
+    return RawSink(sink_spec[1], frame_bytes, seekable=False, close_fd=False)
+
+
+def stream_file(path, fd):
+    # Append a finished segment file to the output pipe, letting the kernel do the copy when it can
+    with open(path, "rb") as segment:
+        size = os.fstat(segment.fileno()).st_size
+        offset = 0
+        try:
+            while offset < size:
+                sent = os.sendfile(fd, segment.fileno(), offset, size - offset)
+                if sent == 0:
+                    break
+                offset += sent
+        except (AttributeError, OSError):
+            segment.seek(offset)
+            while True:
+                data = segment.read(1 << 20)
+                if not data:
+                    break
+                write_all(fd, memoryview(data))
+
+
+# --- Export ---
+def export(
+    path,
+    output,
+    game_index=0,
+    fmt="png",
+    fps=DEFAULT_FPS,
+    workers=1,
+    chunk_moves=DEFAULT_CHUNK_MOVES,
+    start=0,
+    end=None,
+):
+    # Render one recorded game to PNG files in the output directory, or to raw frames in the output file,
+    # FIFO or "-" (stdout); move ranges are rendered in parallel when workers > 1
+    # Returns a summary dictionary
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown format: {fmt!r}")
+    if fps <= 0:
+        raise ValueError("fps must be positive")
+    gui = load_gui()
+    frame_ms = 1000 / fps
+    with ReplayReader(path) as reader:
+        if not 0 <= game_index < len(reader):
+            raise ValueError(f"Game {game_index} out of range, {path} holds {len(reader)} games")
+        record = reader[game_index]
+        end = record.move_count if end is None else min(end, record.move_count)
+        if not 0 <= start <= end:
+            raise ValueError(f"Invalid move range {start}..{end} for a game of {record.move_count} moves")
+        if (record.rows, record.cols) != (gui.ROWS, gui.COLS):
+            gui.set_board_size(record.rows, record.cols)
+        segments, total_frames = plan_segments(gui, record, start, end, frame_ms, max(1, chunk_moves))
+    width, height = gui.WIDTH, gui.HEIGHT
+    layout = gui.pygame.Surface((width, height))  # Same format as the worker surfaces
+    frame_bytes = layout.get_pitch() * height
+
+    def tasks(sink_for):
+        return [
+            (path, game_index, segment, index == 0, index == len(segments) - 1, frame_ms, sink_for(segment))
+            for index, segment in enumerate(segments)
+        ]
+
+    start_time = time.perf_counter()
+    temporary = None
+    out_fd = None
+    try:
+        if fmt == "png":
+            os.makedirs(output, exist_ok=True)
+            work = tasks(lambda segment: ("png", output))
+        elif output != "-" and (not os.path.exists(output) or stat.S_ISREG(os.stat(output).st_mode)):
+            # A regular file is preallocated and every worker writes its frames in place
+            with open(output, "wb") as file:
+                file.truncate(total_frames * frame_bytes)
+            work = tasks(lambda segment: ("file", output, 0))
+        else:
+            out_fd = sys.stdout.fileno() if output == "-" else os.open(output, os.O_WRONLY)
+            if output == "-":
+                sys.stdout.flush()
+            if workers <= 1:
+                work = tasks(lambda segment: ("stream", out_fd))
+            else:
+                # Pipes cannot be written out of order, so workers fill segment files that are streamed in turn
+                temporary = tempfile.mkdtemp(prefix="2048-export-")
+                work = tasks(lambda segment: ("file", os.path.join(temporary, f"{segment[0]:010d}.raw"), segment[0]))
+                for task in work:
+                    open(task[-1][1], "wb").close()
+
+        frames = 0
+        if workers <= 1:
+            for task in work:
+                frames += render_segment(task)
+        else:
+            with multiprocessing.Pool(workers) as pool:
+                # Segments come back in order, so finished segment files can be streamed right away
+                for task, count in zip(work, pool.imap(render_segment, work)):
+                    frames += count
+                    if temporary is not None:
+                        stream_file(task[-1][1], out_fd)
+                        os.unlink(task[-1][1])
+    finally:
+        if temporary is not None:
+            shutil.rmtree(temporary, ignore_errors=True)
+        if out_fd is not None and output != "-":
+            os.close(out_fd)
+    elapsed = time.perf_counter() - start_time
+    video_seconds = frames / fps
+    summary = {
+        "frames": frames,
+        "moves": end - start,
+        "format": fmt,
+        "size": f"{width}x{height}",
+        "fps": fps,
+        "workers": workers,
+        "elapsed_seconds": round(elapsed, 3),
+        "video_seconds": round(video_seconds, 3),
+        "realtime_factor": round(video_seconds / elapsed, 2) if elapsed else 0.0,
+    }
+    if fmt == "raw":
+        summary["pixel_format"] = raw_pixel_format(layout)
+    return summary
+
+
+def format_summary(summary, output):
+    lines = [
+        f"frames={summary['frames']} moves={summary['moves']} size={summary['size']} fps={summary['fps']} "
+        f"workers={summary['workers']}",
+        f"elapsed={summary['elapsed_seconds']}s video={summary['video_seconds']}s "
+        f"({summary['realtime_factor']}x real time)",
+    ]
+    if summary["format"] == "raw":
+        lines.append(
+            f"encode with: ffmpeg -f rawvideo -pix_fmt {summary['pixel_format']} -s {summary['size']} "
+            f"-r {summary['fps']} -i {output} game.mp4"
+        )
+    else:
+        lines.append(f"encode with: ffmpeg -framerate {summary['fps']} -i {output}/frame-%06d.png game.mp4")
+    return "\n".join(lines)
+
+
+# --- Command Line ---
+def add_arguments(parser):
+    parser.add_argument("replay", help="replay file to export")
+    parser.add_argument("--game", type=int, default=0, help="index of the game in the replay file")
+    parser.add_argument("--output", required=True, help="directory for png, or file, FIFO or - (stdout) for raw")
+    parser.add_argument("--format", choices=FORMATS, default="png", help="PNG sequence or raw frames")
+    parser.add_argument("--fps", type=int, default=DEFAULT_FPS, help="frames per second of the output")
+    parser.add_argument("--workers", type=int, default=multiprocessing.cpu_count(), help="render processes")
+    parser.add_argument("--chunk-moves", type=int, default=DEFAULT_CHUNK_MOVES, help="moves per worker task")
+    parser.add_argument("--start", type=int, default=0, help="first move to export")
+    parser.add_argument("--end", type=int, default=None, help="export up to this move (default: the last)")
+    parser.set_defaults(run=run)
+
+
+def run(args):
+    try:
+        summary = export(
+            args.replay,
+            args.output,
+            game_index=args.game,
+            fmt=args.format,
+            fps=args.fps,
+            workers=args.workers,
+            chunk_moves=args.chunk_moves,
+            start=args.start,
+            end=args.end,
+        )
+    except (OSError, ReplayError, IndexError, ValueError) as error:
+        print(f"export: {error}", file=sys.stderr)
+        sys.exit(1)
+    # Raw frames on stdout leave only stderr for the report
+    print(format_summary(summary, args.output), file=sys.stderr if args.output == "-" else sys.stdout)
@@ -0,0 +1,228 @@
+import copy
+import random
+import sys
+from array import array
+from collections import deque
+
+from engine import DEFAULT_SPAWN, DIRECTIONS, Game, GameRandom, skip_spawn
+from replay import board_from_bytes, board_to_bytes
+
+# --- History Constants ---
+DEFAULT_MAX_BYTES = 1 << 20  # Memory cap for the stored snapshots; the oldest are evicted first
+CHECKPOINT_INTERVAL = 64  # Snapshots between full copies of the RNG state
+SNAPSHOT_OVERHEAD = sys.getsizeof(object()) + 10 * 8  # Rough size of a Snapshot and its slot pointers
+
+
+# --- RNG State ---
+def pack_rng_state(rng):
+    # Copy the RNG state for a later restore, or None when the RNG cannot save its state
+    # random.Random's Mersenne Twister state (625 words) is packed into 2.5 KB of bytes instead of
+    # a tuple of Python ints, which would take about 22 KB per snapshot
+    getstate = getattr(rng, "getstate", None)
+    if getstate is None:
+        return None
+    state = getstate()
+    if isinstance(state, tuple) and len(state) == 3 and isinstance(state[1], tuple):
+        version, internal, gauss_next = state
+        return version, array("I", internal).tobytes(), gauss_next
+    return state
+
+
+def unpack_rng_state(rng, state):
+    if state is None:
+        return
+    if isinstance(state, tuple) and len(state) == 3 and isinstance(state[1], bytes):
+        version, internal, gauss_next = state
+        state = version, tuple(array("I", internal)), gauss_next
+    rng.setstate(state)
+
+
+# --- Snapshots ---
+class Snapshot:
+    # Everything needed to put a Game back into one position: the board as one byte per cell, the order of
+    # the grid's empty-cell list (spawn cells are drawn from it), the counters and, on checkpoints only, the
+    # RNG state; History rebuilds the RNG state of other snapshots by replaying the spawns since a checkpoint
+    __slots__ = (
+        "cells",
+        "empty_order",
+        "rows",
+        "cols",
+        "score",
+        "moves",
+        "state",
+        "has_kept_playing",
+        "last_spawn",
+        "rng_state",
+    )
+
+    def __init__(self, game, checkpoint=False):
+        board = game.board
+        self.cells = board_to_bytes(board)
+        self.empty_order = game.grid.empty_order()
+        self.rows = board.rows
+        self.cols = board.cols
+        self.score = game.score
+        self.moves = game.moves
+        self.state = game.state
+        self.has_kept_playing = game.has_kept_playing
+        self.last_spawn = game.last_spawn
+        self.rng_state = pack_rng_state(game.rng) if checkpoint else None
+
+    def nbytes(self):
+        # Approximate memory held by this snapshot
+        size = SNAPSHOT_OVERHEAD + sys.getsizeof(self.cells) + sys.getsizeof(self.empty_order)
+        if self.rng_state is not None:
+            size += sum(sys.getsizeof(part) for part in self.rng_state)
+        return size
+
+    def restore(self, game):
+        # Restore the position and counters; the RNG is left to History
+        game.set_board(board_from_bytes(self.cells, self.rows, self.cols), self.empty_order)
+        game.score = self.score
+        game.moves = self.moves
+        game.state = self.state
+        game.has_kept_playing = self.has_kept_playing
+        game.last_spawn = self.last_spawn
+
+
+# --- History ---
+class History:
+    # Undo/redo stack of Snapshots for one Game, bounded by max_bytes
+    # record() after every move, undo()/redo() to step through the stack; recording after an undo
+    # discards the redo entries, like a text editor
+    # Only every checkpoint_interval-th snapshot (and always the oldest) copies the 2.5 KB RNG state; the
+    # others are a few dozen bytes, and restoring them replays at most checkpoint_interval spawn draws
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES, checkpoint_interval=CHECKPOINT_INTERVAL):
+        self.max_bytes = max_bytes
+        self.checkpoint_interval = checkpoint_interval
+        self.snapshots = deque()
+        self.sizes = deque()  # nbytes of every snapshot, so eviction needs no recomputation
+        self.position = -1  # Index of the snapshot matching the current game position
+        self.nbytes = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.snapshots)
+
+    def reset(self, game):
+        # Forget everything and start from the current position of game
+        self.snapshots.clear()
+        self.sizes.clear()
+        self.position = -1
+        self.nbytes = 0
+        self.record(game)
+
+    def record(self, game):
+        # Save the position reached after a move
+        while len(self.snapshots) > self.position + 1:
+            self.snapshots.pop()
+            self.nbytes -= self.sizes.pop()
+        since_checkpoint = self.position - self._checkpoint_before(self.position) if self.snapshots else None
+        checkpoint = since_checkpoint is None or since_checkpoint + 1 >= self.checkpoint_interval
+        snapshot = Snapshot(game, checkpoint)
+        size = snapshot.nbytes()
+        self.snapshots.append(snapshot)
+        self.sizes.append(size)
+        self.position += 1
+        self.nbytes += size
+        # Evict the oldest positions, always keeping the current one
+        while self.nbytes > self.max_bytes and len(self.snapshots) > 1:
+            if self.snapshots[1].rng_state is None:
+                # The oldest snapshot must be a checkpoint, so the ones after it can still be restored
+                self._make_checkpoint(game, 1)
+            self.snapshots.popleft()
+            self.nbytes -= self.sizes.popleft()
+            self.position -= 1
+            self.evictions += 1
+
+    def _checkpoint_before(self, index):
+        # Index of the nearest snapshot at or before index that holds an RNG state
+        while self.snapshots[index].rng_state is None:
+            index -= 1
+        return index
+
+    def _restore_rng(self, rng, index):
+        # Set rng to its state at snapshot index: load the previous checkpoint and replay the spawn draws of
+        # the moves after it, each made on a grid with one more empty cell than the snapshot shows
+        base = self._checkpoint_before(index)
+        unpack_rng_state(rng, self.snapshots[base].rng_state)
+        for position in range(base + 1, index + 1):
+            snapshot = self.snapshots[position]
+            if snapshot.last_spawn is not None:
+                skip_spawn(rng, snapshot.cells.count(0) + 1)
+
+    def _make_checkpoint(self, game, index):
+        # Give a snapshot its own RNG state, computed on a copy of the game's RNG so the game is untouched
+        rng = copy.copy(game.rng)
+        self._restore_rng(rng, index)
+        snapshot = self.snapshots[index]
+        snapshot.rng_state = pack_rng_state(rng)
+        size = snapshot.nbytes()
+        self.nbytes += size - self.sizes[index]
+        self.sizes[index] = size
+
+    def _restore(self, game):
+        self.snapshots[self.position].restore(game)
+        self._restore_rng(game.rng, self.position)
+
+    def can_undo(self):
+        return self.position > 0
+
+    def can_redo(self):
+        return self.position + 1 < len(self.snapshots)
+
+    def undo(self, game):
+        # Step back one move, including its spawn; returns whether anything changed
+        if not self.can_undo():
+            return False
+        self.position -= 1
+        self._restore(game)
+        return True
+
+    def redo(self, game):
+        # Step forward again to the position an undo left, with the same spawn
+        if not self.can_redo():
+            return False
+        self.position += 1
+        self._restore(game)
+        return True
+
+
+# --- Undo Check ---
+def check_undo_spawns(games=50, moves=300, seed=0, max_bytes=DEFAULT_MAX_BYTES, spawn=DEFAULT_SPAWN):
+    # Play seeded random games, undoing every move and then both redoing it and playing it again: each
+    # must reach the same board and spawn as the original move, raising AssertionError otherwise
+    for index in range(games):
+        game = Game(GameRandom(seed * games + index, spawn))
+        history = History(max_bytes)
+        history.reset(game)
+        policy = random.Random(index)
+        while game.state != "lost" and game.moves < moves:
+            if game.state == "won":
+                game.keep_playing()
+            direction = policy.choice(DIRECTIONS)
+            if not game.move(direction):
+                continue
+            history.record(game)
+            expected = game.board, game.last_spawn
+            history.undo(game)
+            history.redo(game)
+            assert (game.board, game.last_spawn) == expected, f"Redo changed the spawn in game {index}"
+            history.undo(game)
+            game.move(direction)
+            assert (game.board, game.last_spawn) == expected, f"Replaying {direction} changed the spawn in game {index}"
+            history.record(game)
+        # Undo as far as the history reaches, then redo everything: the game must end where it was
+        expected = game.board, game.last_spawn, game.score
+        while history.undo(game):
+            pass
+        while history.redo(game):
+            pass
+        assert (game.board, game.last_spawn, game.score) == expected, f"Undo/redo all changed game {index}"
+    return games
+
+
+if __name__ == "__main__":
+    print(f"{check_undo_spawns()} games draw the same spawns after undo, redo and replaying a move")
+    # A small memory cap evicts snapshots, so the oldest kept one has to become a checkpoint
+    print(f"{check_undo_spawns(max_bytes=8 << 10, spawn='classic')} games with evictions and the 90/10 spawns")
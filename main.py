@@ -1,19 +1,30 @@
+import argparse
+import json
 import math
+import os
 import random
+from collections import deque
 
 import pygame
 
-pygame.init()
+from engine import COLS, DEFAULT_SPAWN, ROWS, SPAWN_DISTRIBUTIONS, Game, GameRandom, check_size, parse_size
+from history import History
+from positions import DEFAULT_MIN_VISITS, PositionStore, StoreError, default_path
+from profiling import HISTOGRAM_BINS_MS, PROFILER, FrameLog
+from replay import ReplayReader, ReplayWriter
+from simulate import game_seed
+from tables import CACHE_DIR
 
 # --- Game Constants ---
 FPS = 60
-MOVE_VELOCITY = 20  # Pixels per frame for tile animation
+ANIMATION_SPEED = 1200  # Pixels per second for tile animation, independent of the frame rate
+REPLAY_MOVE_MS = 100  # Time to hold each position during replay playback
+REPLAY_PAUSE_MS = 1000  # Time to hold the first and last position of a replayed game
 
+# Board geometry, updated by set_board_size for other board sizes
+BOARD_PIXELS = 800  # Length of the longer side of the board
 WIDTH = 800
 HEIGHT = 800
-ROWS = 4
-COLS = 4
-
 CELL_HEIGHT = HEIGHT // ROWS
 CELL_WIDTH = WIDTH // COLS
 
@@ -21,31 +32,120 @@ OUTLINE_COLOUR = (187, 173, 160)
 OUTLINE_THICKNESS = 10
 BACKGROUND_COLOUR = (205, 192, 180)
 
+# Profiling HUD, toggled with F3
+HUD_POSITION = (10, 10)
+HUD_SIZE = (320, 200)
+HUD_BACKGROUND = (0, 0, 0, 170)
+HUD_COLOUR = (255, 255, 255)
+HUD_BAR_COLOUR = (246, 124, 95)
+HUD_FONT_SIZE = 20
+
+# Hints, shown in the window caption when H is pressed
+WINDOW_CAPTION = "2048 by @overstimulation on GitHub"
+HINT_BUDGET_MS = 50  # Search time for a hint on a position the store has not seen (4x4 only)
+
 # --- Font Setup ---
 FONT_SIZE = 60
 FONT_COLOUR = (119, 110, 101)
-try:
-    FONT = pygame.font.SysFont("impact", FONT_SIZE)
-except pygame.error:
-    FONT = pygame.font.SysFont(None, FONT_SIZE, bold=True)
+TILE_FONT_SCALE = 0.3  # Tile number height relative to the cell height
+TILE_FONT_DIGITS = 4  # Numbers longer than this are drawn smaller so they still fit in the cell
 
-# --- Global Animation Flag ---
-# This flag will track if a tile animation is currently in progress
-IS_ANIMATING = False
 
-# --- Game State ---
-GAME_STATE = "playing"  # Possible states: "playing", "won", "lost"
+FONT_NAME = "impact"
+# Resolving a system font by name scans every installed font, which is slow, so the resolved file is
+# remembered between runs
+FONT_CACHE_PATH = os.path.join(CACHE_DIR, "fonts.json")
+FONT_PATHS = {}  # Font name -> resolved font file, or None for pygame's default font
+FONTS = {}  # Font size -> loaded font
 
 # --- Pygame Window Setup ---
-GAME_WINDOW = pygame.display.set_mode((WIDTH, HEIGHT))
+# Nothing touches SDL until the GUI starts: importing this module opens no window and loads no fonts
+GAME_WINDOW = None
+
 
-try:
-    icon_surface = pygame.image.load("2048_icon.png")
-    pygame.display.set_icon(icon_surface)
-except pygame.error:
-    pass  # If icon fails to load, continue with default
+def init_display():
+    # Start pygame and open the game window, once; returns the window
+    global GAME_WINDOW
+    if GAME_WINDOW is None:
+        pygame.display.init()
+        pygame.font.init()
+        GAME_WINDOW = pygame.display.set_mode((WIDTH, HEIGHT))
 
-pygame.display.set_caption("2048 by @overstimulation on GitHub")
+        try:
+            icon_surface = pygame.image.load("2048_icon.png")
+            pygame.display.set_icon(icon_surface)
+        except (pygame.error, FileNotFoundError):
+            pass  # If icon fails to load, continue with default
+
+        pygame.display.set_caption(WINDOW_CAPTION)
+    return GAME_WINDOW
+
+
+def close_display():
+    # Shut pygame down and drop everything tied to it, so init_display can start over
+    global GAME_WINDOW
+    pygame.quit()
+    GAME_WINDOW = None
+    FONTS.clear()
+    TILE_SURFACES.clear()
+    STATIC_SURFACES.clear()
+
+
+def resolve_font_path(name):
+    # Find the file of a system font, using the cache file from earlier runs when it is still valid
+    if name in FONT_PATHS:
+        return FONT_PATHS[name]
+    try:
+        with open(FONT_CACHE_PATH) as file:
+            cached = json.load(file)
+    except (OSError, ValueError):
+        cached = {}
+    if not isinstance(cached, dict):
+        cached = {}
+    path = cached.get(name, "")
+    if path == "" or (path is not None and not os.path.exists(path)):
+        path = pygame.font.match_font(name)
+        cached[name] = path
+        try:
+            os.makedirs(os.path.dirname(FONT_CACHE_PATH), exist_ok=True)
+            with open(FONT_CACHE_PATH, "w") as file:
+                json.dump(cached, file)
+        except OSError:
+            pass  # The cache only saves time; a read-only home directory is fine
+    FONT_PATHS[name] = path
+    return path
+
+
+def load_font(size):
+    # Impact when it is installed, otherwise pygame's default font (as SysFont falls back to)
+    font = FONTS.get(size)
+    if font is None:
+        if not pygame.font.get_init():
+            pygame.font.init()
+        try:
+            font = pygame.font.Font(resolve_font_path(FONT_NAME), size)
+        except (pygame.error, OSError):
+            font = pygame.font.Font(None, size)
+            font.set_bold(True)
+        FONTS[size] = font
+    return font
+
+
+def set_board_size(rows, cols):
+    # Switch the GUI to a rows x cols board: cells, outlines and fonts scale to keep the board
+    # BOARD_PIXELS along its longer side, and the window is resized to match
+    global ROWS, COLS, WIDTH, HEIGHT, CELL_WIDTH, CELL_HEIGHT, OUTLINE_THICKNESS, GAME_WINDOW
+    check_size(rows, cols)
+    ROWS, COLS = rows, cols
+    CELL_WIDTH = CELL_HEIGHT = BOARD_PIXELS // max(rows, cols)
+    WIDTH, HEIGHT = CELL_WIDTH * cols, CELL_HEIGHT * rows
+    OUTLINE_THICKNESS = max(2, CELL_WIDTH // 20)
+    # Cached surfaces were drawn for the old cell size
+    TILE_SURFACES.clear()
+    STATIC_SURFACES.clear()
+    if GAME_WINDOW is not None:
+        GAME_WINDOW = pygame.display.set_mode((WIDTH, HEIGHT))
+    return GAME_WINDOW
 
 
 # --- Tile Class ---
@@ -75,30 +175,17 @@ class Tile:
         self.y_position = row * CELL_HEIGHT
         self.target_row = row
         self.target_col = col
-        self.final_value = value
-        self.merged_with = False  # Flag to prevent double merges in one move
 
     def get_tile_colour(self):
-        # Calculate the base index using log2
-        calculated_index = int(math.log2(self.value)) - 1
+        return get_tile_colour(self.value)
 
-        # Ensure the index does not exceed the maximum index in COLOURS
-        colour_index = min(calculated_index, len(self.COLOURS) - 1)
-        return self.COLOURS[colour_index]
+    def get_rect(self):
+        # Screen rectangle currently covered by the tile
+        return pygame.Rect(int(self.x_position), int(self.y_position), CELL_WIDTH, CELL_HEIGHT)
 
     def draw_tile(self, window):
-        # Draw the tile rectangle and the number text centered
-        colour = self.get_tile_colour()
-        pygame.draw.rect(window, colour, (self.x_position, self.y_position, CELL_WIDTH, CELL_HEIGHT))
-
-        text = FONT.render(str(self.value), 1, FONT_COLOUR)
-        window.blit(
-            text,
-            (
-                self.x_position + (CELL_WIDTH / 2 - text.get_width() / 2),
-                self.y_position + (CELL_HEIGHT / 2 - text.get_height() / 2),
-            ),
-        )
+        # Blit the pre-rendered surface for this value (rectangle and centered number)
+        return window.blit(get_tile_surface(self.value), (self.x_position, self.y_position))
 
     def move_tile(self, delta_x, delta_y):
         # Update the tile's pixel position incrementally
@@ -106,6 +193,55 @@ class Tile:
         self.y_position += delta_y
 
 
+def get_tile_colour(value):
+    # Calculate the base index using log2
+    calculated_index = int(math.log2(value)) - 1
+
+    # Ensure the index does not exceed the maximum index in COLOURS
+    colour_index = min(calculated_index, len(Tile.COLOURS) - 1)
+    return Tile.COLOURS[colour_index]
+
+
+# --- Surface Caches ---
+# Surfaces are rendered once on first use and then only blitted
+TILE_SURFACES = {}  # Tile value -> surface with the tile colour and its number
+STATIC_SURFACES = {}  # "grid", "lost" and "won" -> full-window transparent layers
+
+
+def get_tile_surface(value):
+    surface = TILE_SURFACES.get(value)
+    if surface is None:
+        surface = pygame.Surface((CELL_WIDTH, CELL_HEIGHT))
+        surface.fill(get_tile_colour(value))
+        text = get_tile_font(value).render(str(value), 1, FONT_COLOUR)
+        surface.blit(text, (CELL_WIDTH / 2 - text.get_width() / 2, CELL_HEIGHT / 2 - text.get_height() / 2))
+        TILE_SURFACES[value] = surface
+    return surface
+
+
+def get_tile_font(value):
+    # Scale tile numbers with the cell size, shrinking long numbers so they fit
+    digits = max(len(str(value)), TILE_FONT_DIGITS)
+    size = max(1, int(min(CELL_HEIGHT, CELL_WIDTH * TILE_FONT_DIGITS / digits) * TILE_FONT_SCALE))
+    return load_font(size)
+
+
+def get_static_surface(name):
+    surface = STATIC_SURFACES.get(name)
+    if surface is None:
+        surface = pygame.Surface((WIDTH, HEIGHT), pygame.SRCALPHA)
+        if name == "grid":
+            draw_grid(surface)
+        elif name == "lost":
+            render_game_over(surface)
+        elif name == "won":
+            render_game_won(surface)
+        else:
+            raise ValueError(f"Unknown surface: {name!r}")
+        STATIC_SURFACES[name] = surface
+    return surface
+
+
 # --- Drawing Functions ---
 def draw_grid(window):
     # Draw the grid lines and the outer border
@@ -124,7 +260,7 @@ def draw_grid(window):
 
 
 def draw_elements(window, tiles):
-    # Fill background, draw all tiles, then draw the grid
+    # Fill background, draw all tiles, then draw the cached grid; returns the number of surfaces blitted
     window.fill(BACKGROUND_COLOUR)
 
     # Sort tiles by value for drawing, so smaller tiles are drawn first during animation
@@ -133,379 +269,562 @@ def draw_elements(window, tiles):
     for tile in sorted_tiles_for_drawing:
         tile.draw_tile(window)
 
-    draw_grid(window)
+    window.blit(get_static_surface("grid"), (0, 0))
+    return len(tiles) + 1
 
 
-def draw_game_over(window):
-    # Create a semi-transparent overlay to darken the background
-    overlay = pygame.Surface((WIDTH, HEIGHT), pygame.SRCALPHA)
-    overlay.fill((0, 0, 0, 128))  # RGBA: black with alpha for transparency
-    window.blit(overlay, (0, 0))
+def overlay_scale(box_width, box_height):
+    # Overlay boxes, fonts and line spacing are laid out for the default 800x800 window; shrink them together
+    # so the message still fits on short or narrow boards
+    return min(1.0, WIDTH / box_width, HEIGHT / box_height)
+
+
+def render_game_over(surface):
+    # Semi-transparent overlay to darken the background
+    surface.fill((0, 0, 0, 128))  # RGBA: black with alpha for transparency
 
     # Draw the message box in the center
-    message_box_width, message_box_height = 600, 200  # Box size for the overlay message
+    scale = overlay_scale(600, 200)
+    message_box_width, message_box_height = int(600 * scale), int(200 * scale)  # Box size for the overlay message
     message_box_x = (WIDTH - message_box_width) // 2
     message_box_y = (HEIGHT - message_box_height) // 2
-    pygame.draw.rect(window, BACKGROUND_COLOUR, (message_box_x, message_box_y, message_box_width, message_box_height))
+    pygame.draw.rect(surface, BACKGROUND_COLOUR, (message_box_x, message_box_y, message_box_width, message_box_height))
     pygame.draw.rect(
-        window, OUTLINE_COLOUR, (message_box_x, message_box_y, message_box_width, message_box_height), OUTLINE_THICKNESS
+        surface,
+        OUTLINE_COLOUR,
+        (message_box_x, message_box_y, message_box_width, message_box_height),
+        OUTLINE_THICKNESS,
     )
 
     # Render and center the "Game Over!" and restart instructions
-    game_over_text = FONT.render("Game Over!", True, FONT_COLOUR)
-    restart_text = FONT.render("Press SPACE to Restart", True, FONT_COLOUR)
-    window.blit(game_over_text, game_over_text.get_rect(center=(WIDTH // 2, HEIGHT // 2 - 30)))
-    window.blit(restart_text, restart_text.get_rect(center=(WIDTH // 2, HEIGHT // 2 + 30)))
+    font = load_font(max(1, int(FONT_SIZE * scale)))
+    spacing = 30 * scale
+    game_over_text = font.render("Game Over!", True, FONT_COLOUR)
+    restart_text = font.render("Press SPACE to Restart", True, FONT_COLOUR)
+    surface.blit(game_over_text, game_over_text.get_rect(center=(WIDTH // 2, HEIGHT // 2 - spacing)))
+    surface.blit(restart_text, restart_text.get_rect(center=(WIDTH // 2, HEIGHT // 2 + spacing)))
 
 
-def draw_game_won(window):
-    # Create a semi-transparent gold overlay to highlight the win
-    overlay = pygame.Surface((WIDTH, HEIGHT), pygame.SRCALPHA)
-    overlay.fill((255, 215, 0, 128))  # RGBA: gold with alpha for transparency
-    window.blit(overlay, (0, 0))
+def render_game_won(surface):
+    # Semi-transparent gold overlay to highlight the win
+    surface.fill((255, 215, 0, 128))  # RGBA: gold with alpha for transparency
 
     # Draw the message box in the center
-    message_box_width, message_box_height = 700, 250  # Box size for the overlay message
+    scale = overlay_scale(700, 250)
+    message_box_width, message_box_height = int(700 * scale), int(250 * scale)  # Box size for the overlay message
     message_box_x = (WIDTH - message_box_width) // 2
     message_box_y = (HEIGHT - message_box_height) // 2
-    pygame.draw.rect(window, BACKGROUND_COLOUR, (message_box_x, message_box_y, message_box_width, message_box_height))
+    pygame.draw.rect(surface, BACKGROUND_COLOUR, (message_box_x, message_box_y, message_box_width, message_box_height))
     pygame.draw.rect(
-        window, OUTLINE_COLOUR, (message_box_x, message_box_y, message_box_width, message_box_height), OUTLINE_THICKNESS
+        surface,
+        OUTLINE_COLOUR,
+        (message_box_x, message_box_y, message_box_width, message_box_height),
+        OUTLINE_THICKNESS,
     )
 
     # Render and center the win message and instructions
-    win_text = FONT.render("You Won!", True, FONT_COLOUR)
-    restart_text = FONT.render("Press SPACE to Restart", True, FONT_COLOUR)
-    continue_text = FONT.render("Press C to Keep Playing", True, FONT_COLOUR)
-    window.blit(win_text, win_text.get_rect(center=(WIDTH // 2, HEIGHT // 2 - 60)))
-    window.blit(restart_text, restart_text.get_rect(center=(WIDTH // 2, HEIGHT // 2)))
-    window.blit(continue_text, continue_text.get_rect(center=(WIDTH // 2, HEIGHT // 2 + 60)))
-
-
-# --- Tile Generation and Placement ---
-def get_random_position(tiles):
-    # Find a random empty position in the grid
-    while True:
-        row, col = random.randrange(ROWS), random.randrange(COLS)
-        if f"{row}{col}" not in tiles:
-            return row, col
-
-
-# --- Game Logic Functions ---
-def move_tiles(window, tiles, clock, direction):
-    # Declare IS_ANIMATING as global to modify it
-    global IS_ANIMATING
-
-    # Set the flag to True at the start of the move animation
-    IS_ANIMATING = True
-
-    # Create a list of tiles for processing
-    tile_list = list(tiles.values())
-    tiles_to_remove = []
-    move_or_merge_occurred = False  # Flag to track if any tile moved or merged
-
-    # Reset merge status for the new move
-    for tile in tile_list:
-        tile.merged_with = False
-        tile.final_value = tile.value  # Reset final value
-
-    # --- Simulate the move to determine target positions and merges ---
-
-    # Determine sort order and movement delta based on direction
-    if direction == "up":
-        sort_key = lambda tile: tile.row
-        reverse_sort = False
-        delta_row, delta_col = -1, 0
-    elif direction == "down":
-        sort_key = lambda tile: tile.row
-        reverse_sort = True
-        delta_row, delta_col = 1, 0
-    elif direction == "left":
-        sort_key = lambda tile: tile.col
-        reverse_sort = False
-        delta_row, delta_col = 0, -1
-    elif direction == "right":
-        sort_key = lambda tile: tile.col
-        reverse_sort = True
-        delta_row, delta_col = 0, 1
+    font = load_font(max(1, int(FONT_SIZE * scale)))
+    spacing = 60 * scale
+    win_text = font.render("You Won!", True, FONT_COLOUR)
+    restart_text = font.render("Press SPACE to Restart", True, FONT_COLOUR)
+    continue_text = font.render("Press C to Keep Playing", True, FONT_COLOUR)
+    surface.blit(win_text, win_text.get_rect(center=(WIDTH // 2, HEIGHT // 2 - spacing)))
+    surface.blit(restart_text, restart_text.get_rect(center=(WIDTH // 2, HEIGHT // 2)))
+    surface.blit(continue_text, continue_text.get_rect(center=(WIDTH // 2, HEIGHT // 2 + spacing)))
+
+
+def draw_game_over(window):
+    window.blit(get_static_surface("lost"), (0, 0))
+
+
+def draw_game_won(window):
+    window.blit(get_static_surface("won"), (0, 0))
+
+
+# --- Dirty Rectangle Renderer ---
+class Renderer:
+    # Redraws and updates only the parts of the window that changed since the previous frame
+    # With present=False it draws into any offscreen surface and never touches the display
+    def __init__(self, window, present=True):
+        self.window = window
+        self.present = present
+        self.drawn = set()  # (x, y, value) of every tile on screen
+        self.overlay = None  # Name of the overlay on screen ("lost", "won" or None)
+        self.hud_rect = None  # Area covered by the profiling HUD, repainted every frame while shown
+        self.needs_full_redraw = True
+
+    def invalidate(self):
+        # Force the next draw to repaint the whole window
+        self.needs_full_redraw = True
+
+    def draw(self, tiles, overlay=None, hud=None):
+        # Bring the window up to date with tiles, the overlay and an optional HUD surface drawn on top,
+        # returning the updated rectangles
+        current = {(int(tile.x_position), int(tile.y_position), tile.value) for tile in tiles.values()}
+        hud_rect = hud.get_rect(topleft=HUD_POSITION) if hud is not None else None
+        if self.needs_full_redraw or overlay != self.overlay:
+            surfaces = draw_elements(self.window, tiles)
+            if overlay is not None:
+                self.window.blit(get_static_surface(overlay), (0, 0))
+                surfaces += 1
+            dirty = [self.window.get_rect()]
+        else:
+            dirty = [pygame.Rect(x, y, CELL_WIDTH, CELL_HEIGHT) for x, y, _ in current ^ self.drawn]
+            # The HUD changes every frame, and the board must be repainted where it was last shown
+            for rect in {tuple(rect) for rect in (self.hud_rect, hud_rect) if rect is not None}:
+                dirty.append(pygame.Rect(rect))
+            surfaces = self.redraw_regions(tiles, dirty, overlay) if dirty else 0
+        if hud is not None:
+            self.window.blit(hud, hud_rect)
+            surfaces += 1
+
+        self.drawn = current
+        self.overlay = overlay
+        self.hud_rect = hud_rect
+        self.needs_full_redraw = False
+        if dirty and self.present:
+            pygame.display.update(dirty)
+        PROFILER.count("surfaces", surfaces)
+        return dirty
+
+    def redraw_regions(self, tiles, regions, overlay):
+        # Repaint each region from scratch: background, overlapping tiles, grid and overlay
+        # Returns the number of surfaces blitted
+        sorted_tiles = sorted(tiles.values(), key=lambda tile: tile.value)
+        grid = get_static_surface("grid")
+        surfaces = 0
+        for region in regions:
+            self.window.set_clip(region)
+            self.window.fill(BACKGROUND_COLOUR)
+            for tile in sorted_tiles:
+                if region.colliderect(tile.get_rect()):
+                    tile.draw_tile(self.window)
+                    surfaces += 1
+            self.window.blit(grid, (0, 0))
+            surfaces += 1
+            if overlay is not None:
+                self.window.blit(get_static_surface(overlay), (0, 0))
+                surfaces += 1
+        self.window.set_clip(None)
+        return surfaces
+
+
+# --- Profiling HUD ---
+def render_hud(profiler):
+    # Summary of the last frames: FPS, frame times, time per stage, surfaces per frame and a histogram
+    surface = pygame.Surface(HUD_SIZE, pygame.SRCALPHA)
+    surface.fill(HUD_BACKGROUND)
+    font = load_font(HUD_FONT_SIZE)
+    summary = profiler.summary()
+    if summary:
+        lines = [
+            f"FPS {summary['fps']:.1f}  frame {summary['frame_ms']:.1f} ms (p99 {summary['frame_ms_p99']:.1f})",
+            f"draw {summary.get('draw_ms', 0):.2f} ms  surfaces {summary.get('surfaces', 0):.1f}",
+            f"move {summary.get('move_ms', 0):.2f} ms  animation {summary.get('animation_ms', 0):.2f} ms",
+        ]
+        if "ai_ms" in summary:
+            lines.append(f"ai {summary['ai_ms']:.1f} ms")
     else:
-        IS_ANIMATING = False
-        return False  # Invalid direction
-
-    # Sort tiles based on direction for simulation
-    sorted_tiles_for_simulation = sorted(tile_list, key=sort_key, reverse=reverse_sort)
-
-    # Create a temporary grid representation to simulate moves
-    temp_grid = [[None for _ in range(COLS)] for _ in range(ROWS)]
-    for tile in tile_list:
-        temp_grid[tile.row][tile.col] = tile  # Populate temp grid with current tiles
-
-    # Simulate moves and merges
-    for tile in sorted_tiles_for_simulation:
-        current_row, current_col = tile.row, tile.col
-        target_row, target_col = current_row, current_col
-        next_row, next_col = current_row + delta_row, current_col + delta_col
-
-        while 0 <= next_row < ROWS and 0 <= next_col < COLS:
-            next_tile = temp_grid[next_row][next_col]
-
-            if next_tile is None:
-                # Move to the next empty cell in the simulation
-                target_row, target_col = next_row, next_col
-                # Update next cell to check
-                next_row += delta_row
-                next_col += delta_col
-
-            elif next_tile.value == tile.value and not next_tile.merged_with:
-                # Merge with the next tile if values match and it hasn't been merged into this move
-                target_row, target_col = next_row, next_col
-                tiles_to_remove.append(tile)  # This tile will be removed visually and from the list later
-                next_tile.final_value *= 2  # Update the final value of the target tile
-                next_tile.merged_with = True  # Mark the target tile as merged into
-                move_or_merge_occurred = True  # Indicate a merge happened
-
-                # Update temp grid to reflect the merge: the moving tile is removed
-                temp_grid[current_row][current_col] = None
-                break  # Stop checking in this direction after a merge
-            else:
-                # Cannot move past the next tile (either different value or already merged into)
-                # The tile stops at its current position before this blocking tile
-                break
-
-        # Set the tile's target grid position based on the simulation
-        tile.target_row, tile.target_col = target_row, target_col
-        # If the tile's target is different from its current position, a move occurred
-        if (tile.row, tile.col) != (tile.target_row, tile.target_col):
-            move_or_merge_occurred = True
-        # Update temp grid to reflect the tile's final simulated position if it wasn't removed by merge
-        if tile not in tiles_to_remove and temp_grid[current_row][current_col] == tile:
-            temp_grid[current_row][current_col] = None
-            temp_grid[tile.target_row][tile.target_col] = tile
-
-    # If no move or merge occurred in the simulation, no animation is needed
-    if not move_or_merge_occurred:
-        IS_ANIMATING = False
-        return False
-
-    # --- Animation Loop ---
-    animation_complete = False
-    while not animation_complete:
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                pygame.quit()
-                exit()
+        lines = ["Collecting frames..."]
+    line_height = font.get_linesize()
+    for index, line in enumerate(lines):
+        surface.blit(font.render(line, True, HUD_COLOUR), (8, 6 + index * line_height))
+
+    # Frame time histogram along the bottom, one bar per bin
+    counts = profiler.histogram()
+    labels = [f"<{bound:g}" for bound in HISTOGRAM_BINS_MS] + [f">{HISTOGRAM_BINS_MS[-1]:g}"]
+    bar_top = 6 + 4 * line_height
+    bar_bottom = HUD_SIZE[1] - line_height - 4
+    bar_width = (HUD_SIZE[0] - 16) // len(counts)
+    total = max(1, sum(counts))
+    for index, (count, label) in enumerate(zip(counts, labels)):
+        x = 8 + index * bar_width
+        height = round((bar_bottom - bar_top) * count / total)
+        pygame.draw.rect(surface, HUD_BAR_COLOUR, (x + 2, bar_bottom - height, bar_width - 4, height))
+        text = font.render(label, True, HUD_COLOUR)
+        surface.blit(text, (x + (bar_width - text.get_width()) // 2, bar_bottom + 2))
+    return surface
+
+
+# --- Board Conversion ---
+def tiles_from_board(board):
+    # Build the GUI tiles dictionary from an engine board
+    tiles = {}
+    for row in range(board.rows):
+        for col in range(board.cols):
+            value = board.get(row, col)
+            if value:
+                tiles[(row, col)] = Tile(value, row, col)
+    return tiles
 
-        animation_complete = True  # Assume animation is complete unless a tile is still moving
 
-        for tile in tile_list:
-            # Animate all tiles that were initially part of this move
-            # Exclude tiles that are being removed by a merge from pixel movement calculation,
-            # but keep them in tile_list for drawing until the end of animation.
-            # Their target position was set during the simulation.
+# --- Animation ---
+class MoveAnimation:
+    # Slides the tiles of one move towards their targets, driven by elapsed time rather than frame count
+    def __init__(self, board, direction, final_board):
+        # board is the position before the move, final_board the position after it (including the spawn)
+        targets = board.move_targets(direction)
+        self.tile_list = list(tiles_from_board(board).values())
+        for tile in self.tile_list:
+            tile.target_row, tile.target_col = targets[(tile.row, tile.col)]
+        # Use unique keys for drawing to avoid clashes if multiple tiles end up at the same target temporarily
+        self.tiles = {f"{tile.row}_{tile.col}_{id(tile)}": tile for tile in self.tile_list}
+        self.final_tiles = tiles_from_board(final_board)
+        self.finished = False
 
+    def update(self, elapsed_ms):
+        # Advance every tile by the distance covered in elapsed_ms; returns True once all tiles arrived
+        step = ANIMATION_SPEED * elapsed_ms / 1000
+        animation_complete = True  # Assume animation is complete unless a tile is still moving
+        for tile in self.tile_list:
+            # Tiles that merge into another slide onto it and are dropped when the animation ends
             target_x = tile.target_col * CELL_WIDTH
             target_y = tile.target_row * CELL_HEIGHT
             # Calculate the distance to the target pixel position
             dx, dy = target_x - tile.x_position, target_y - tile.y_position
 
-            # Move by MOVE_VELOCITY or the remaining distance, whichever is smaller
-            move_x = min(abs(dx), MOVE_VELOCITY) * (1 if dx > 0 else -1)
-            # If moving by MOVE_VELOCITY would overshoot, move exactly to the target
-            if abs(move_x) > abs(dx):
-                move_x = dx
-            tile.x_position += move_x
-
-            move_y = min(abs(dy), MOVE_VELOCITY) * (1 if dy > 0 else -1)
-            # If moving by MOVE_VELOCITY would overshoot, move exactly to the target
-            if abs(move_y) > abs(dy):
-                move_y = dy
-            tile.y_position += move_y
+            # Move by step or the remaining distance, whichever is smaller, so tiles never overshoot
+            tile.move_tile(max(-step, min(step, dx)), max(-step, min(step, dy)))
 
             # Check if the tile has reached its target pixel position
             if tile.x_position != target_x or tile.y_position != target_y:
                 animation_complete = False  # At least one tile is still moving
 
-        # Redraw elements during animation
-        # Draw all tiles in the initial tile_list at their current animated positions.
-        # Tiles marked for removal will be visually animated until they reach the target
-        # and are removed from the main tiles dictionary after the animation.
-        # We need to create a dictionary from the tile_list for draw_elements
-        # Use unique keys for drawing to avoid clashes if multiple tiles end up at the same target temporarily
-        drawing_tiles_during_animation = {f"{t.row}_{t.col}_{id(t)}": t for t in tile_list}
-        draw_elements(window, drawing_tiles_during_animation)
-        pygame.display.update()
-        clock.tick(FPS)
-
-    # --- After animation, update actual tile grid positions, values, and remove merged tiles ---
-    new_tiles = {}
-
-    for tile in tile_list:
-        if tile not in tiles_to_remove:
-            # Update the tile's actual grid row and col to the target
-            tile.row, tile.col = tile.target_row, tile.target_col
-            # Ensure pixel position is exactly at the center of the target cell
-            tile.x_position, tile.y_position = tile.target_col * CELL_WIDTH, tile.target_row * CELL_HEIGHT
-            # Update the tile's value to its final value AFTER animation
-            tile.value = tile.final_value
-            # Add to the new tiles dictionary using the final grid position as the key
-            new_tiles[f"{tile.row}{tile.col}"] = tile
-
-    tiles.clear()
-    tiles.update(new_tiles)
-
-    # Redraw one last time after the tiles dictionary is fully updated
-    draw_elements(window, tiles)
-    pygame.display.update()
-
-    IS_ANIMATING = False
-    return move_or_merge_occurred  # Return whether any tile moved or merged
-
-
-def end_move(tiles):
-    # Actions after tiles stop moving
-    # Check for game over (no more possible moves)
-    if len(tiles) == ROWS * COLS:
-        # Basic check: if the grid is full, check if any merges are possible
-        for row in range(ROWS):
-            for col in range(COLS):
-                tile = tiles.get(f"{row}{col}")
-                if tile:
-                    # Check right
-                    if col < COLS - 1:
-                        right_tile = tiles.get(f"{row}{col + 1}")
-                        if right_tile and right_tile.value == tile.value:
-                            return "continue"  # Possible merge
-                    # Check down
-                    if row < ROWS - 1:
-                        down_tile = tiles.get(f"{row + 1}{col}")
-                        if down_tile and down_tile.value == tile.value:
-                            return "continue"  # Possible merge
-        return "lost"  # No possible moves
-
-    # Add a new tile (2 or 4)
-    row, col = get_random_position(tiles)
-    if row is not None and col is not None:
-        tiles[f"{row}{col}"] = Tile(random.choice([2, 4]), row, col)
-    return "continue"
-
-
-def generate_tiles():
-    # Create the initial two tiles for a new game
-    tiles = {}
-    for _ in range(2):
-        row, col = get_random_position(tiles)
-        if row is not None and col is not None:
-            tiles[f"{row}{col}"] = Tile(2, row, col)
-
-    return tiles
-
-
-def is_game_over(tiles):
-    if len(tiles) < ROWS * COLS:
-        return False
-    for row in range(ROWS):
-        for col in range(COLS):
-            tile = tiles.get(f"{row}{col}")
-            if tile:
-                if col < COLS - 1:
-                    right_tile = tiles.get(f"{row}{col + 1}")
-                    if right_tile and right_tile.value == tile.value:
-                        return False
-                if row < ROWS - 1:
-                    down_tile = tiles.get(f"{row + 1}{col}")
-                    if down_tile and down_tile.value == tile.value:
-                        return False
-    return True
+        self.finished = animation_complete
+        return self.finished
+
+
+class AnimationQueue:
+    # Moves are applied to the game immediately and queued here for display, so no key press is lost
+    # When more moves are waiting, the running animation is skipped to catch up
+    def __init__(self, tiles):
+        self.tiles = tiles  # Tiles shown when nothing is animating
+        self.pending = deque()  # (board before, direction, board after) still to be shown
+        self.current = None
+
+    def push(self, board, direction, final_board):
+        self.pending.append((board, direction, final_board))
+
+    def reset(self, tiles):
+        # Drop every queued animation and show tiles (e.g. after a restart)
+        self.pending.clear()
+        self.current = None
+        self.tiles = tiles
+
+    def is_idle(self):
+        return self.current is None and not self.pending
+
+    def update(self, elapsed_ms):
+        # Advance the animations by elapsed_ms and return the tiles to draw this frame
+        if self.current is not None and self.pending:
+            # The player is ahead of the animation, so jump to the end of the current move
+            self.tiles = self.current.final_tiles
+            self.current = None
+        if self.current is None and self.pending:
+            self.current = MoveAnimation(*self.pending.popleft())
+            elapsed_ms = 0  # Show the starting position of the new move first
+        if self.current is not None and self.current.update(elapsed_ms):
+            self.tiles = self.current.final_tiles
+            self.current = None
+        return self.current.tiles if self.current is not None else self.tiles
+
+
+# --- Hints ---
+def open_positions(path):
+    # Open the position store: the given file, or the default one for this board size if it exists
+    if path is None:
+        path = default_path(ROWS, COLS)
+        if not os.path.exists(path):
+            return None
+    try:
+        return PositionStore(path, ROWS, COLS)
+    except (OSError, StoreError) as error:
+        print(f"Hints will not use the position store: {error}")
+        return None
+
+
+def find_hint(board, positions, searcher):
+    # Return (direction, source) for the H key: the best recorded move if the store has seen the position,
+    # else a short search on 4x4 boards; direction is None when neither has an answer
+    if positions is not None:
+        stats = positions.lookup(board)
+        direction = stats.best_move(DEFAULT_MIN_VISITS) if stats is not None else None
+        if direction is not None:
+            return direction, f"played {stats.total_visits} times"
+    if searcher is not None:
+        return searcher.best_move(board, HINT_BUDGET_MS), "search"
+    return None, "unknown position"
+
+
+def show_hint(direction, source):
+    if direction is None:
+        pygame.display.set_caption(f"{WINDOW_CAPTION} - no hint ({source})")
+    else:
+        pygame.display.set_caption(f"{WINDOW_CAPTION} - hint: {direction} ({source})")
 
 
 # --- Main Game Loop ---
-def main(window):
-    global GAME_STATE
+def main(
+    window, ai_budget_ms=None, record_path=None, profile_log=None, seed=None, spawn=DEFAULT_SPAWN, positions_path=None
+):
+    # When ai_budget_ms is set, the expectimax AI plays the moves with that time budget per move
+    # When record_path is set, every game is saved to that replay file
+    # When profile_log is set, per-frame timings are written to that .csv or JSON lines file
+    # seed fixes the tile spawns of the session (random when None): game n of the session is seeded with
+    # simulate.game_seed(seed, n), like game n of a simulation run; spawn names the value distribution
+    # positions_path names the position store for H hints (see open_positions); the AI only uses a store
+    # given explicitly, so a cached store filled by weaker policies never replaces its search
     clock = pygame.time.Clock()
+    renderer = Renderer(window)
     game_running = True
-    has_kept_playing = False
-    tiles = generate_tiles()
+    if seed is None:
+        seed = random.randrange(1 << 63)
+    game_number = 0
+    game = Game(GameRandom(game_seed(seed, game_number), spawn), ROWS, COLS)
+    played = []  # Direction of every move of the current game, kept past an undo so redo can record it again
+    positions = open_positions(positions_path)
+    searcher = None
+    if ai_budget_ms is not None:
+        from ai import Searcher
+
+        searcher = Searcher(spawn=spawn, positions=positions if positions_path is not None else None)
+    hint_searcher = None  # Created on the first hint that needs a search
+    hint_shown = False
+    writer = None
+    if record_path is not None:
+        writer = ReplayWriter(record_path)
+        writer.start_game(game.board, game_seed(seed, game_number))
+    history = History()
+    history.reset(game)
+    tiles = tiles_from_board(game.board)
+
+    # Profiling stays off, and nearly free, until F3 shows the HUD or a log is requested
+    hud_visible = False
+    frame_log = None
+    if profile_log is not None:
+        frame_log = FrameLog(profile_log)
+        PROFILER.add_hook(frame_log)
+    PROFILER.enabled = frame_log is not None
 
     # --- FORCE WIN FOR TESTING ---
-    # tiles["00"] = Tile(1024, 0, 0)
-    # tiles["01"] = Tile(1024, 0, 1)
+    # game.board = game.board.place(0, 0, 1024).place(0, 1, 1024)
+    # tiles = tiles_from_board(game.board)
 
     # --- FORCE LOSE FOR TESTING ---
-    # tiles.clear()
-    # values = [
-    #     [2, 4, 2, 4],
-    #     [4, 2, 4, 2],
-    #     [2, 4, 2, 4],
-    #     [4, 2, 4, 2],
-    # ]
-    # for row in range(4):
-    #     for col in range(4):
-    #         tiles[f"{row}{col}"] = Tile(values[row][col], row, col)
+    # for row in range(ROWS):
+    #     for col in range(COLS):
+    #         game.board = game.board.place(row, col, 4 if (row + col) % 2 else 2)
+    # tiles = tiles_from_board(game.board)
 
     # Main loop
+    animations = AnimationQueue(tiles)
     while game_running:
-        clock.tick(FPS)
+        elapsed_ms = clock.tick(FPS)
 
-        # Event handling
+        # Event handling: moves are collected in order and applied right away, even mid-animation
+        actions = []
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
                 game_running = False
 
-            # Only process key presses if no animation is in progress
-            if event.type == pygame.KEYDOWN and not IS_ANIMATING:
+            if event.type == pygame.KEYDOWN:
+                # F3 toggles the profiling HUD
+                if event.key == pygame.K_F3:
+                    hud_visible = not hud_visible
+                    PROFILER.enabled = hud_visible or frame_log is not None
+                # U undoes the last move (including its spawn) and R redoes it, also from the overlays
+                elif event.key == pygame.K_u:
+                    actions.append("undo")
+                elif event.key == pygame.K_r:
+                    actions.append("redo")
+                # H shows the suggested move in the window caption until the board changes
+                elif event.key == pygame.K_h and game.state == "playing":
+                    if hint_searcher is None and (ROWS, COLS) == (4, 4):
+                        from ai import Searcher
+
+                        hint_searcher = Searcher(spawn=spawn)
+                    start = PROFILER.start()
+                    show_hint(*find_hint(game.board, positions, hint_searcher))
+                    PROFILER.stop("ai_ms", start)
+                    hint_shown = True
                 # Handle arrow key presses for movement
-                if GAME_STATE == "playing":
-                    direction = None
+                elif game.state == "playing":
                     if event.key == pygame.K_UP:
-                        direction = "up"
+                        actions.append("up")
                     elif event.key == pygame.K_DOWN:
-                        direction = "down"
+                        actions.append("down")
                     elif event.key == pygame.K_LEFT:
-                        direction = "left"
+                        actions.append("left")
                     elif event.key == pygame.K_RIGHT:
-                        direction = "right"
-
-                    # Only attempt to move if a valid direction was determined
-                    if direction:
-                        # Call move_tiles and check if a move or merge occurred
-                        move_occurred = move_tiles(window, tiles, clock, direction)
-                        # Spawn new tile only if a move or merge happened
-                        if move_occurred:
-                            # Check for win before end_move
-                            # Only show win screen if player hasn't chosen to keep playing
-                            if not has_kept_playing and any(tile.value == 2048 for tile in tiles.values()):
-                                GAME_STATE = "won"
-                            else:
-                                # Call end_move to add a new tile and check for loss
-                                game_state_result = end_move(tiles)
-                                if game_state_result == "lost":
-                                    GAME_STATE = "lost"
-                        else:
-                            # If no move occurred check if the game is over (no possible moves)
-                            if is_game_over(tiles):
-                                GAME_STATE = "lost"
-                elif GAME_STATE in ["won", "lost"]:
+                        actions.append("right")
+                elif game.state in ["won", "lost"]:
                     if event.key == pygame.K_SPACE:
-                        # Restart the game
-                        tiles = generate_tiles()
-                        GAME_STATE = "playing"
-                        has_kept_playing = False  # Reset when restarting
-                    elif event.key == pygame.K_c and GAME_STATE == "won":
+                        # Restart the game on the next seed of the session
+                        game_number += 1
+                        game.rng = GameRandom(game_seed(seed, game_number), spawn)
+                        game.restart()
+                        played = []
+                        history.reset(game)
+                        animations.reset(tiles_from_board(game.board))
+                        if writer is not None:
+                            writer.start_game(game.board, game_seed(seed, game_number))
+                    elif event.key == pygame.K_c and game.state == "won":
                         # Continue playing after winning
-                        GAME_STATE = "playing"
-                        has_kept_playing = True  # Set when continuing
-
-        # Drawing (ensure the initial state is drawn and updates happen during animation)
-        if not IS_ANIMATING:
-            draw_elements(window, tiles)
-            if GAME_STATE == "lost":  # Draw the lose overlay
-                draw_game_over(window)
-            elif GAME_STATE == "won":  # Draw the win overlay
-                draw_game_won(window)
-            pygame.display.update()
+                        game.keep_playing()
+
+        # Let the AI pick a move once the previous animation has finished
+        if searcher is not None and game_running and game.state == "playing" and animations.is_idle():
+            start = PROFILER.start()
+            actions.append(searcher.best_move(game.board, ai_budget_ms))
+            PROFILER.stop("ai_ms", start)
+
+        for action in actions:
+            if action in ("undo", "redo"):
+                changed = history.undo(game) if action == "undo" else history.redo(game)
+                if changed:
+                    animations.reset(tiles_from_board(game.board))
+                    if hint_shown:
+                        pygame.display.set_caption(WINDOW_CAPTION)
+                        hint_shown = False
+                    if writer is not None:
+                        # A replay is one line of moves: an undo cuts the recorded game back, a redo replays
+                        # the undone move into it again
+                        if action == "undo":
+                            writer.truncate(game.moves)
+                        else:
+                            writer.record_move(played[game.moves - 1], game.last_spawn)
+                continue
+            # Moves queued behind a win or loss are dropped, like key presses on the overlay
+            if action is None or game.state != "playing":
+                continue
+            # The engine applies the move, checks for a win and spawns the new tile
+            start = PROFILER.start()
+            board_before_move = game.board
+            if game.move(action):
+                history.record(game)
+                del played[game.moves - 1 :]
+                played.append(action)
+                if writer is not None:
+                    writer.record_move(action, game.last_spawn)
+                animations.push(board_before_move, action, game.board)
+                if hint_shown:
+                    pygame.display.set_caption(WINDOW_CAPTION)
+                    hint_shown = False
+            PROFILER.stop("move_ms", start)
+
+        start = PROFILER.start()
+        tiles = animations.update(elapsed_ms)
+        PROFILER.stop("animation_ms", start)
+
+        # Drawing: only the changed tiles are repainted, and nothing at all while idle
+        start = PROFILER.start()
+        # Draw the lose or win overlay on top of the board once the last move has been shown
+        overlay = game.state if game.state in ["won", "lost"] and animations.is_idle() else None
+        renderer.draw(tiles, overlay, render_hud(PROFILER) if hud_visible else None)
+        PROFILER.stop("draw_ms", start)
+        PROFILER.end_frame(elapsed_ms)
+
+    PROFILER.enabled = False
+    if frame_log is not None:
+        PROFILER.remove_hook(frame_log)
+        frame_log.close()
+    if searcher is not None:
+        from ai import format_stats
+
+        print(format_stats(searcher))
+    if writer is not None:
+        writer.close()
+    if positions is not None:
+        positions.close()
+
+    close_display()
+
+
+# --- Replay Playback ---
+def replay(window, path, game_index=None):
+    # Animate recorded games through the normal renderer, one game or the whole file
+    clock = pygame.time.Clock()
+    renderer = Renderer(window)
+    with ReplayReader(path) as reader:
+        records = reader.games() if game_index is None else [reader[game_index]]
+        for record in records:
+            board = record.initial_board
+            if (board.rows, board.cols) != (ROWS, COLS):
+                # Recordings keep their own board size
+                window = set_board_size(board.rows, board.cols)
+                renderer = Renderer(window)
+            positions = record.positions()
+            animations = AnimationQueue(tiles_from_board(board))
+            hold_ms = REPLAY_PAUSE_MS  # Time left to show the current position before the next move
+            game_finished = False
+            while True:
+                elapsed_ms = clock.tick(FPS)
+                if any(event.type == pygame.QUIT for event in pygame.event.get()):
+                    return
+
+                if animations.is_idle():
+                    hold_ms -= elapsed_ms
+                    if hold_ms <= 0:
+                        if game_finished:
+                            break
+                        next_position = next(positions, None)
+                        if next_position is None:
+                            # Hold the final position (with the game over overlay if it was lost)
+                            game_finished = True
+                            hold_ms = REPLAY_PAUSE_MS
+                        else:
+                            next_board, _, direction, _ = next_position
+                            animations.push(board, direction, next_board)
+                            board = next_board
+                            hold_ms = REPLAY_MOVE_MS
 
-    pygame.quit()
+                tiles = animations.update(elapsed_ms)
+                overlay = "lost" if game_finished and board.is_terminal() else None
+                renderer.draw(tiles, overlay)
+
+    # Leave the last position on screen until the window is closed
+    while not any(event.type == pygame.QUIT for event in pygame.event.get()):
+        clock.tick(FPS)
 
 
 if __name__ == "__main__":
-    main(GAME_WINDOW)
+    parser = argparse.ArgumentParser(description="2048 by @overstimulation on GitHub")
+    parser.add_argument("--size", default=f"{ROWS}x{COLS}", help="board size as RxC, from 2x2 up to 16x16")
+    parser.add_argument("--ai", action="store_true", help="let the expectimax AI play (4x4 only)")
+    parser.add_argument("--ai-budget", type=int, default=100, help="AI time budget per move in ms")
+    parser.add_argument("--seed", type=int, default=None, help="seed for the tile spawns, to replay the same games")
+    parser.add_argument(
+        "--spawn", choices=SPAWN_DISTRIBUTIONS, default=DEFAULT_SPAWN, help="tile value distribution (classic is 90/10)"
+    )
+    parser.add_argument("--record", metavar="FILE", default=None, help="save every game to a replay file")
+    parser.add_argument("--replay", metavar="FILE", default=None, help="play back a recorded replay file")
+    parser.add_argument("--replay-game", type=int, default=None, help="only play back this game of the file")
+    parser.add_argument(
+        "--profile-log", metavar="FILE", default=None, help="write per-frame timings to a .csv or JSON lines file"
+    )
+    parser.add_argument(
+        "--positions", metavar="FILE", default=None, help="position store for H hints (default: cached one) and the AI"
+    )
+    args = parser.parse_args()
+    try:
+        rows, cols = parse_size(args.size)
+    except ValueError as error:
+        parser.error(str(error))
+    if args.ai and (rows, cols) != (4, 4):
+        parser.error("--ai only supports 4x4 boards")
+    if (rows, cols) != (ROWS, COLS):
+        set_board_size(rows, cols)
+
+    if args.replay is not None:
+        replay(init_display(), args.replay, args.replay_game)
+        close_display()
+    else:
+        main(
+            init_display(),
+            ai_budget_ms=args.ai_budget if args.ai else None,
+            record_path=args.record,
+            profile_log=args.profile_log,
+            seed=args.seed,
+            spawn=args.spawn,
+            positions_path=args.positions,
+        )
@@ -0,0 +1,428 @@
+import argparse
+import mmap
+import os
+import struct
+import tempfile
+import zlib
+from collections import OrderedDict
+from operator import itemgetter
+
+from engine import COLS, DIRECTIONS, ROWS, check_size, parse_size
+from replay import board_from_bytes, board_to_bytes
+from tables import CACHE_DIR
+
+# --- Store Constants ---
+DEFAULT_CACHE_SIZE = 100_000  # Positions kept in the in-memory LRU front of a store
+# Visits a move needs before it can be suggested: with final scores varying by thousands between games, fewer
+# visits leave the average of a move dominated by the luck of single games
+DEFAULT_MIN_VISITS = 30
+MAX_LOAD = 0.7  # Highest fraction of used slots in the on-disk hash table
+
+# --- Symmetries ---
+# The 8 symmetries of the square (dihedral group D4) as (swaps rows and cols, (row, col) -> new (row, col));
+# rectangular boards only have the 4 that keep their shape
+SYMMETRIES = (
+    (False, lambda row, col, rows, cols: (row, col)),  # Identity
+    (True, lambda row, col, rows, cols: (col, rows - 1 - row)),  # Rotate 90 degrees clockwise
+    (False, lambda row, col, rows, cols: (rows - 1 - row, cols - 1 - col)),  # Rotate 180 degrees
+    (True, lambda row, col, rows, cols: (cols - 1 - col, row)),  # Rotate 270 degrees clockwise
+    (False, lambda row, col, rows, cols: (row, cols - 1 - col)),  # Mirror left-right
+    (False, lambda row, col, rows, cols: (rows - 1 - row, col)),  # Flip top-bottom
+    (True, lambda row, col, rows, cols: (col, row)),  # Transpose
+    (True, lambda row, col, rows, cols: (cols - 1 - col, rows - 1 - row)),  # Anti-transpose
+)
+DIRECTION_VECTORS = {"up": (-1, 0), "down": (1, 0), "left": (0, -1), "right": (0, 1)}
+
+# Cache of (cell getter, direction index map) for every symmetry, keyed by board size
+_SYMMETRY_MAPS = {}
+
+
+def symmetry_maps(rows, cols):
+    # For every symmetry of a rows x cols board, return a getter that picks the cells of the transformed
+    # board from the original cells, and the index in DIRECTIONS each direction index is mapped to
+    key = (rows, cols)
+    maps = _SYMMETRY_MAPS.get(key)
+    if maps is None:
+        maps = []
+        vectors = {vector: index for index, vector in enumerate(DIRECTION_VECTORS[d] for d in DIRECTIONS)}
+        for swaps, transform in SYMMETRIES:
+            if swaps and rows != cols:
+                continue
+            order = [0] * (rows * cols)
+            for row in range(rows):
+                for col in range(cols):
+                    new_row, new_col = transform(row, col, rows, cols)
+                    order[new_row * cols + new_col] = row * cols + col
+            # Directions are vectors, so map one step from the centre of a 3x3 board
+            origin = transform(1, 1, 3, 3)
+            directions = []
+            for direction in DIRECTIONS:
+                delta_row, delta_col = DIRECTION_VECTORS[direction]
+                moved = transform(1 + delta_row, 1 + delta_col, 3, 3)
+                directions.append(vectors[(moved[0] - origin[0], moved[1] - origin[1])])
+            maps.append((itemgetter(*order), directions))
+        _SYMMETRY_MAPS[key] = maps
+    return maps
+
+
+def canonical(cells, rows, cols):
+    # Return (key, symmetry index) of a board given as exponent bytes: the key is the smallest byte string
+    # among its symmetric copies, so all of them share one store entry
+    best, best_index = None, 0
+    for index, (getter, _) in enumerate(symmetry_maps(rows, cols)):
+        candidate = bytes(getter(cells))
+        if best is None or candidate < best:
+            best, best_index = candidate, index
+    return best, best_index
+
+
+# --- Position Statistics ---
+class PositionStats:
+    # Visits and summed outcomes (final game scores) of one position, per direction played from it,
+    # in the order of engine.DIRECTIONS
+    __slots__ = ("visits", "outcomes")
+
+    def __init__(self, visits=None, outcomes=None):
+        self.visits = list(visits) if visits is not None else [0] * len(DIRECTIONS)
+        self.outcomes = list(outcomes) if outcomes is not None else [0.0] * len(DIRECTIONS)
+
+    def __repr__(self):
+        return f"PositionStats(visits={self.total_visits}, best={self.best_move()}, average={self.average_outcome:.1f})"
+
+    @property
+    def total_visits(self):
+        return sum(self.visits)
+
+    @property
+    def average_outcome(self):
+        total = self.total_visits
+        return sum(self.outcomes) / total if total else 0.0
+
+    def average(self, direction):
+        index = DIRECTIONS.index(direction)
+        return self.outcomes[index] / self.visits[index] if self.visits[index] else 0.0
+
+    def best_move(self, min_visits=1):
+        # The direction with the best average outcome among those visited at least min_visits times,
+        # preferring more visits on ties
+        visited = [index for index, visits in enumerate(self.visits) if visits >= min_visits]
+        if not visited:
+            return None
+        best = max(visited, key=lambda index: (self.outcomes[index] / self.visits[index], self.visits[index]))
+        return DIRECTIONS[best]
+
+    def add(self, other):
+        for index in range(len(DIRECTIONS)):
+            self.visits[index] += other.visits[index]
+            self.outcomes[index] += other.outcomes[index]
+
+    def copy(self):
+        return PositionStats(self.visits, self.outcomes)
+
+    def mapped(self, directions):
+        # Statistics with direction index i moved to directions[i], e.g. from canonical to board orientation
+        stats = PositionStats()
+        for index, target in enumerate(directions):
+            stats.visits[target] = self.visits[index]
+            stats.outcomes[target] = self.outcomes[index]
+        return stats
+
+
+# --- Store File ---
+# A little-endian header followed by an open-addressing hash table of fixed-size slots:
+#   magic (8s), version (u16), rows (u8), cols (u8), slot count (u64, a power of two), entries (u64),
+#   padding up to HEADER_SIZE
+#   slot: key (rows * cols exponent bytes of the canonical board, all zero when the slot is empty),
+#         visits per direction (4 x u32), outcome sum per direction (4 x f64)
+# A lookup hashes the key with CRC-32 and probes linearly, so it touches one or two slots at MAX_LOAD
+MAGIC = b"2048POS\x00"
+VERSION = 1
+HEADER = struct.Struct("<8sHBBQQ")
+HEADER_SIZE = 32
+VALUE = struct.Struct(f"<{len(DIRECTIONS)}I{len(DIRECTIONS)}d")
+
+
+class StoreError(Exception):
+    pass
+
+
+def default_path(rows=ROWS, cols=COLS):
+    return os.path.join(CACHE_DIR, f"positions-{rows}x{cols}.bin")
+
+
+def table_capacity(count):
+    capacity = 16
+    while count > capacity * MAX_LOAD:
+        capacity *= 2
+    return capacity
+
+
+class PositionStore:
+    # Statistics of played positions keyed by canonical board, so the up to 8 symmetric copies of a
+    # position share one entry; recorded positions are kept in memory until flush() rewrites the file
+    # Lookups go through an LRU front of cache_size entries before the memory-mapped file
+    # With path=None the store lives in memory only, e.g. to collect results in a worker process
+    def __init__(self, path=None, rows=ROWS, cols=COLS, cache_size=DEFAULT_CACHE_SIZE):
+        check_size(rows, cols)
+        self.path = path
+        self.rows = rows
+        self.cols = cols
+        self.cells = rows * cols
+        self.slot_size = self.cells + VALUE.size
+        self.cache_size = cache_size
+        self.cache = OrderedDict()  # Canonical key -> PositionStats on disk, or None when absent
+        self.pending = {}  # Canonical key -> PositionStats recorded since the last flush
+        self.hits = 0
+        self.misses = 0
+        self._file = None
+        self._data = None
+        self.capacity = 0
+        self.count = 0  # Entries in the file
+        if path is not None and os.path.exists(path):
+            self._open()
+
+    def _open(self):
+        self._file = open(self.path, "rb")
+        try:
+            self._data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self._file.close()
+            raise StoreError(f"{self.path} is empty") from None
+        if len(self._data) < HEADER_SIZE:
+            self.close()
+            raise StoreError(f"{self.path} is truncated")
+        magic, version, rows, cols, capacity, count = HEADER.unpack_from(self._data)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise StoreError(f"{self.path} is not a version {VERSION} position store")
+        if (rows, cols) != (self.rows, self.cols):
+            self.close()
+            raise StoreError(f"{self.path} holds {rows}x{cols} positions, not {self.rows}x{self.cols}")
+        if len(self._data) != HEADER_SIZE + capacity * self.slot_size:
+            self.close()
+            raise StoreError(f"{self.path} has the wrong size")
+        self.capacity = capacity
+        self.count = count
+
+    def close(self):
+        # Unmap the file; pending positions are kept until flush()
+        if self._data is not None:
+            self._data.close()
+            self._file.close()
+        self._data = None
+        self._file = None
+        self.capacity = 0
+        self.count = 0
+        self.cache.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.pending and self.path is not None:
+            self.flush()
+        self.close()
+
+    def __len__(self):
+        return self.count + sum(1 for key in self.pending if self._read(key) is None)
+
+    # --- Lookups ---
+    def _read(self, key):
+        # Statistics stored in the file for a canonical key, or None
+        if not self.capacity:
+            return None
+        data = self._data
+        mask = self.capacity - 1
+        slot = zlib.crc32(key) & mask
+        while True:
+            offset = HEADER_SIZE + slot * self.slot_size
+            stored = data[offset : offset + self.cells]
+            if stored == key:
+                values = VALUE.unpack_from(data, offset + self.cells)
+                return PositionStats(values[: len(DIRECTIONS)], values[len(DIRECTIONS) :])
+            if not any(stored):
+                return None
+            slot = (slot + 1) & mask
+
+    def _get(self, key):
+        # Statistics of a canonical key from the LRU front, the file and the pending records combined
+        cache = self.cache
+        if key in cache:
+            cache.move_to_end(key)
+            stats = cache[key]
+            self.hits += 1
+        else:
+            stats = self._read(key)
+            cache[key] = stats
+            if len(cache) > self.cache_size:
+                cache.popitem(last=False)
+            self.misses += 1
+        delta = self.pending.get(key)
+        if delta is not None:
+            stats = stats.copy() if stats is not None else PositionStats()
+            stats.add(delta)
+        return stats
+
+    def lookup(self, board):
+        # Statistics of an engine Board with directions in the board's own orientation, or None if unknown
+        if (board.rows, board.cols) != (self.rows, self.cols):
+            return None
+        key, symmetry = canonical(board_to_bytes(board), self.rows, self.cols)
+        stats = self._get(key)
+        if stats is None:
+            return None
+        directions = symmetry_maps(self.rows, self.cols)[symmetry][1]
+        inverse = [0] * len(directions)
+        for index, target in enumerate(directions):
+            inverse[target] = index
+        return stats.mapped(inverse)
+
+    def suggest(self, board, min_visits=DEFAULT_MIN_VISITS):
+        # Best recorded move for a board among the moves played at least min_visits times from it, or None
+        stats = self.lookup(board)
+        return stats.best_move(min_visits) if stats is not None else None
+
+    # --- Recording ---
+    def record(self, board, direction, outcome):
+        # Count one visit of board where direction was played and the game ended with outcome
+        key, symmetry = canonical(board_to_bytes(board), self.rows, self.cols)
+        stats = self.pending.get(key)
+        if stats is None:
+            stats = self.pending[key] = PositionStats()
+        index = symmetry_maps(self.rows, self.cols)[symmetry][1][DIRECTIONS.index(direction)]
+        stats.visits[index] += 1
+        stats.outcomes[index] += outcome
+
+    def record_game(self, moves, outcome):
+        # Record every (board, direction) of one game with its final outcome
+        for board, direction in moves:
+            self.record(board, direction, outcome)
+
+    def merge(self, entries):
+        # Add canonical entries in bulk: a {key: PositionStats} mapping (e.g. another store's pending
+        # records sent back by a worker) or another PositionStore of the same size
+        if isinstance(entries, PositionStore):
+            if (entries.rows, entries.cols) != (self.rows, self.cols):
+                raise StoreError(f"Cannot merge {entries.rows}x{entries.cols} positions into {self.rows}x{self.cols}")
+            entries = entries.items()
+        elif isinstance(entries, dict):
+            entries = entries.items()
+        for key, delta in entries:
+            stats = self.pending.get(key)
+            if stats is None:
+                self.pending[key] = delta.copy()
+            else:
+                stats.add(delta)
+
+    def items(self):
+        # Yield (canonical key, PositionStats) for every entry, with the pending records included
+        pending = self.pending
+        on_disk = set()
+        if self.capacity:
+            data = self._data
+            for slot in range(self.capacity):
+                offset = HEADER_SIZE + slot * self.slot_size
+                key = data[offset : offset + self.cells]
+                if not any(key):
+                    continue
+                values = VALUE.unpack_from(data, offset + self.cells)
+                stats = PositionStats(values[: len(DIRECTIONS)], values[len(DIRECTIONS) :])
+                delta = pending.get(key)
+                if delta is not None:
+                    stats.add(delta)
+                    on_disk.add(key)
+                yield key, stats
+        for key, stats in pending.items():
+            if key not in on_disk:
+                yield key, stats
+
+    def flush(self):
+        # Rewrite the file with the pending records merged in; the new file replaces the old atomically,
+        # so readers in other processes keep a consistent (older) table until they reopen it
+        if self.path is None:
+            raise StoreError("An in-memory store cannot be flushed")
+        if not self.pending and self._data is not None:
+            return
+        count = len(self)
+        capacity = table_capacity(count)
+        mask = capacity - 1
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        descriptor, temporary = tempfile.mkstemp(dir=directory, prefix=".positions-")
+        try:
+            with os.fdopen(descriptor, "w+b") as file:
+                file.truncate(HEADER_SIZE + capacity * self.slot_size)
+                file.write(HEADER.pack(MAGIC, VERSION, self.rows, self.cols, capacity, count))
+                file.flush()
+                with mmap.mmap(file.fileno(), 0) as data:
+                    # Inserting in key order makes the file independent of the order positions were recorded in
+                    for key, stats in sorted(self.items(), key=itemgetter(0)):
+                        slot = zlib.crc32(key) & mask
+                        offset = HEADER_SIZE + slot * self.slot_size
+                        while any(data[offset : offset + self.cells]):
+                            slot = (slot + 1) & mask
+                            offset = HEADER_SIZE + slot * self.slot_size
+                        data[offset : offset + self.cells] = key
+                        VALUE.pack_into(data, offset + self.cells, *stats.visits, *stats.outcomes)
+            os.chmod(temporary, 0o644)
+            os.replace(temporary, self.path)
+        except BaseException:
+            if os.path.exists(temporary):
+                os.unlink(temporary)
+            raise
+        self.close()
+        self.pending = {}
+        self._open()
+
+
+# --- Command Line ---
+def main():
+    parser = argparse.ArgumentParser(description="Inspect and merge position stores")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    info = subparsers.add_parser("info", help="print the size of a store and its most visited positions")
+    info.add_argument("path")
+    info.add_argument("--size", default=f"{ROWS}x{COLS}", help="board size of the store")
+    info.add_argument("--top", type=int, default=5, help="most visited positions to show")
+    merge = subparsers.add_parser("merge", help="merge stores, e.g. from parallel simulation runs, into one")
+    merge.add_argument("output")
+    merge.add_argument("inputs", nargs="+")
+    merge.add_argument("--size", default=f"{ROWS}x{COLS}", help="board size of the stores")
+    args = parser.parse_args()
+    try:
+        rows, cols = parse_size(args.size)
+    except ValueError as error:
+        parser.error(str(error))
+
+    try:
+        if args.command == "merge":
+            merge_files(args.output, args.inputs, rows, cols)
+        else:
+            print_info(args.path, rows, cols, args.top)
+    except (OSError, StoreError) as error:
+        parser.exit(1, f"error: {error}\n")
+
+
+def merge_files(output_path, input_paths, rows, cols):
+    with PositionStore(output_path, rows, cols) as output:
+        for path in input_paths:
+            if not os.path.exists(path):
+                raise StoreError(f"{path} does not exist")
+            with PositionStore(path, rows, cols) as store:
+                output.merge(store)
+        output.flush()
+        print(f"{output_path}: {len(output):,} positions")
+
+
+def print_info(path, rows, cols, top):
+    if not os.path.exists(path):
+        raise StoreError(f"{path} does not exist")
+    with PositionStore(path, rows, cols) as store:
+        size = os.path.getsize(path)
+        print(f"{path}: {store.count:,} positions in {store.capacity:,} slots ({size:,} bytes)")
+        for key, stats in sorted(store.items(), key=lambda item: item[1].total_visits, reverse=True)[:top]:
+            print(board_from_bytes(key, rows, cols))
+            print(stats)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+import csv
+import json
+import os
+import time
+from collections import deque
+
+# --- Profiling Constants ---
+FRAME_HISTORY = 600  # Frames kept for the HUD and export (10 seconds at 60 FPS)
+HISTOGRAM_BINS_MS = (8.3, 16.7, 20.0, 33.3, 50.0)  # Upper bounds of the frame time bins; the last bin is open
+FIELDS = ("frame", "frame_ms", "move_ms", "animation_ms", "draw_ms", "ai_ms", "surfaces")  # CSV columns
+
+
+# --- Profiler ---
+class Profiler:
+    # Per-frame timers and counters for the game loop
+    # Call sites use start()/stop() and count(), which return at once while the profiler is disabled,
+    # so leaving the hooks in the hot path costs one attribute check each
+    # end_frame() closes a frame record and passes it to every hook, e.g. a FrameLog
+    def __init__(self, history=FRAME_HISTORY):
+        self.enabled = False
+        self.frames = deque(maxlen=history)  # Most recent frame records
+        self.values = {}  # Timers (ms) and counters of the frame in progress
+        self.hooks = []
+        self.frame_count = 0
+
+    def start(self):
+        # Start a timer; pass the result to stop()
+        return time.perf_counter() if self.enabled else None
+
+    def stop(self, name, start):
+        # Add the milliseconds since start() to the named timer of this frame
+        if start is not None and self.enabled:
+            self.values[name] = self.values.get(name, 0.0) + (time.perf_counter() - start) * 1000
+
+    def count(self, name, amount=1):
+        if self.enabled:
+            self.values[name] = self.values.get(name, 0) + amount
+
+    def end_frame(self, frame_ms):
+        # Close the current frame, given the wall time since the previous one
+        if not self.enabled:
+            return None
+        record = {"frame": self.frame_count, "frame_ms": frame_ms, **self.values}
+        self.frame_count += 1
+        self.values = {}
+        self.frames.append(record)
+        for hook in self.hooks:
+            hook(record)
+        return record
+
+    def add_hook(self, hook):
+        # hook(record) runs after every frame with the frame's dictionary
+        self.hooks.append(hook)
+
+    def remove_hook(self, hook):
+        self.hooks.remove(hook)
+
+    def reset(self):
+        self.frames.clear()
+        self.values = {}
+
+    # --- Summaries ---
+    def summary(self):
+        # Mean of every timer and counter over the kept frames, plus FPS and the slowest frame times
+        frames = list(self.frames)
+        if not frames:
+            return {}
+        totals = {}
+        for record in frames:
+            for name, value in record.items():
+                if name != "frame":
+                    totals[name] = totals.get(name, 0) + value
+        summary = {name: value / len(frames) for name, value in totals.items()}
+        frame_times = sorted(record["frame_ms"] for record in frames)
+        summary["fps"] = 1000 / summary["frame_ms"] if summary["frame_ms"] else 0.0
+        summary["frame_ms_p99"] = frame_times[min(len(frame_times) - 1, int(0.99 * len(frame_times)))]
+        summary["frame_ms_max"] = frame_times[-1]
+        return summary
+
+    def histogram(self, bins=HISTOGRAM_BINS_MS):
+        # Count the kept frames per frame time bin; returns one count per bound plus one open bin
+        counts = [0] * (len(bins) + 1)
+        for record in self.frames:
+            index = 0
+            while index < len(bins) and record["frame_ms"] > bins[index]:
+                index += 1
+            counts[index] += 1
+        return counts
+
+    def export(self, path):
+        # Write the kept frame records to a .csv file, or JSON lines for any other extension
+        with FrameLog(path) as log:
+            for record in self.frames:
+                log(record)
+
+
+# --- Frame Logs ---
+class FrameLog:
+    # Profiler hook that streams every frame record to a file as it happens, for headless runs
+    # .csv files get one row per frame with the FIELDS columns, anything else gets JSON lines
+    def __init__(self, path):
+        self.file = open(path, "w", newline="")
+        self.writer = None
+        if os.path.splitext(path)[1].lower() == ".csv":
+            self.writer = csv.DictWriter(self.file, FIELDS, restval=0, extrasaction="ignore")
+            self.writer.writeheader()
+
+    def __call__(self, record):
+        if self.writer is not None:
+            self.writer.writerow(
+                {name: round(value, 4) if isinstance(value, float) else value for name, value in record.items()}
+            )
+        else:
+            self.file.write(json.dumps(record) + "\n")
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+PROFILER = Profiler()  # Shared by the GUI; other tools can enable it and add hooks
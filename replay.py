@@ -0,0 +1,420 @@
+import mmap
+import struct
+import sys
+from array import array
+
+from engine import DIRECTIONS, Board
+
+# --- Replay Format ---
+# A replay file is a header followed by an append-only stream of chunks, then a footer index:
+#
+#   header    MAGIC, version (u16)
+#   chunk     tag (1 byte) + payload, one of:
+#     "G"     game start: seed (u64), rows (u8), cols (u8), initial board exponents (rows * cols bytes)
+#     "M"     move block: count (u16), then count packed moves (u16 each)
+#     "K"     keyframe: move index (u32), score (u64), board exponents (rows * cols bytes)
+#     "E"     game end: move count (u32), score (u64)
+#   footer    "F", game count (u64), keyframe count (u64), then one fixed-size record per game: game offset,
+#             move count, score, index of its first keyframe record, keyframe count (u64 each); then one
+#             record per keyframe of every game in order: move index, offset (u64 each)
+#   trailer   footer offset (u64), END_MAGIC
+#
+# The footer records have a fixed size, so a reader finds game i at a computed offset and decodes only
+# the games it opens, however many the file holds.
+# A packed move holds the direction in bits 0-1, a spawn flag in bit 2, the spawn exponent in
+# bits 3-7 and the spawn cell index in bits 8-15, so boards of up to 256 cells fit.
+MAGIC = b"2048RPL\x00"
+END_MAGIC = b"2048END\x00"
+VERSION = 1
+DEFAULT_KEYFRAME_INTERVAL = 256  # Moves between keyframes, bounding the replay work of a seek
+
+HEADER = struct.Struct("<8sH")
+GAME_START = struct.Struct("<QBB")
+MOVE_BLOCK = struct.Struct("<H")
+KEYFRAME = struct.Struct("<IQ")
+GAME_END = struct.Struct("<IQ")
+FOOTER = struct.Struct("<QQ")
+FOOTER_GAME = struct.Struct("<5Q")
+FOOTER_KEYFRAME = struct.Struct("<2Q")
+TRAILER = struct.Struct("<Q8s")
+PACKED_MOVE = struct.Struct("<H")
+
+SEED_MASK = (1 << 64) - 1
+
+
+class ReplayError(Exception):
+    # Raised when a replay file is malformed
+    pass
+
+
+# --- Encoding Helpers ---
+def pack_move(direction, spawn, cols):
+    # Pack a direction and an optional (row, col, value) spawn into 16 bits
+    packed = DIRECTIONS.index(direction)
+    if spawn is not None:
+        row, col, value = spawn
+        packed |= 0b100 | ((value.bit_length() - 1) << 3) | ((row * cols + col) << 8)
+    return packed
+
+
+def unpack_move(packed, cols):
+    # Inverse of pack_move, returning (direction, spawn)
+    direction = DIRECTIONS[packed & 0b11]
+    if not packed & 0b100:
+        return direction, None
+    row, col = divmod(packed >> 8, cols)
+    return direction, (row, col, 1 << ((packed >> 3) & 0b11111))
+
+
+def board_to_bytes(board):
+    return bytes(value.bit_length() - 1 if value else 0 for value in board.cells)
+
+
+def board_from_bytes(data, rows, cols):
+    return Board([1 << exponent if exponent else 0 for exponent in data], rows, cols)
+
+
+def apply_move(board, direction, spawn):
+    # Replay one recorded move, returning (board, score_delta)
+    board, score_delta, _ = board.move(direction)
+    if spawn is not None:
+        row, col, value = spawn
+        board = board.place(row, col, value)
+    return board, score_delta
+
+
+# --- Writer ---
+class ReplayWriter:
+    # Streams games to a file; moves are buffered and flushed as blocks between keyframes
+    def __init__(self, path, keyframe_interval=DEFAULT_KEYFRAME_INTERVAL):
+        self.file = open(path, "w+b")  # Readable too, so truncate() can read back a flushed move block
+        self.keyframe_interval = keyframe_interval
+        # Footer records kept as flat u64 arrays in the footer layout, so a long session stays compact
+        self.games = array("Q")  # offset, moves, score, first keyframe, keyframe count per game
+        self.keyframes = array("Q")  # move index, offset per keyframe
+        self._board = None
+        self._pending = []
+        self._score = 0
+        self._moves = 0
+        self._base = None  # (board, score) at the last keyframe or game start, where _pending begins
+        self.file.write(HEADER.pack(MAGIC, VERSION))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def start_game(self, board, seed=0):
+        # Begin recording a new game from its initial board (ending the previous one if needed)
+        if self._board is not None:
+            self.end_game()
+        if board.rows * board.cols > 256:
+            raise ValueError("Replays support boards of at most 256 cells")
+        offset = self.file.tell()
+        self.file.write(b"G" + GAME_START.pack(seed & SEED_MASK, board.rows, board.cols) + board_to_bytes(board))
+        self.games.extend((offset, 0, 0, len(self.keyframes) // 2, 0))
+        self._board = board
+        self._score = 0
+        self._moves = 0
+        self._pending = []
+        self._base = board, 0
+
+    def record_move(self, direction, spawn):
+        # Record one move and the tile spawned after it (None when no tile spawned, e.g. on the win screen)
+        if self._board is None:
+            raise ReplayError("record_move called before start_game")
+        self._board, score_delta = apply_move(self._board, direction, spawn)
+        self._score += score_delta
+        self._moves += 1
+        self._pending.append(pack_move(direction, spawn, self._board.cols))
+        if self._moves % self.keyframe_interval == 0:
+            self._flush_moves()
+            offset = self.file.tell()
+            self.file.write(b"K" + KEYFRAME.pack(self._moves, self._score) + board_to_bytes(self._board))
+            self.keyframes.extend((self._moves, offset))
+            self.games[-1] += 1
+            self._base = self._board, self._score
+
+    def truncate(self, move_count):
+        # Cut the current game back to its first move_count moves, e.g. after an undo, so the moves played
+        # next continue the same game
+        if self._board is None:
+            raise ReplayError("truncate called before start_game")
+        if not 0 <= move_count <= self._moves:
+            raise ValueError(f"Cannot truncate a game of {self._moves} moves to {move_count}")
+        first, count = self.games[-2], self.games[-1]
+        kept = count
+        while kept and self.keyframes[2 * (first + kept - 1)] > move_count:
+            kept -= 1
+        if kept < count:
+            # Rewind the file to the last kept keyframe (or the game start) and read back the move block
+            # written after it, which holds the moves up to the first dropped keyframe
+            cells = self._board.rows * self._board.cols
+            if kept:
+                offset = self.keyframes[2 * (first + kept - 1) + 1]
+                _, score = KEYFRAME.unpack(self._read(offset + 1, KEYFRAME.size))
+                start = offset + 1 + KEYFRAME.size
+            else:
+                score = 0
+                start = self.games[-5] + 1 + GAME_START.size
+            board = board_from_bytes(self._read(start, cells), self._board.rows, self._board.cols)
+            end = start + cells
+            (block_count,) = MOVE_BLOCK.unpack(self._read(end + 1, MOVE_BLOCK.size))
+            self._pending = list(struct.unpack(f"<{block_count}H", self.file.read(2 * block_count)))
+            self.file.seek(end)
+            self.file.truncate()
+            del self.keyframes[2 * (first + kept) :]
+            self.games[-1] = kept
+            self._base = board, score
+        base_moves = self.keyframes[2 * (first + kept - 1)] if kept else 0
+        del self._pending[move_count - base_moves :]
+        self._board, self._score = self._base
+        for packed in self._pending:
+            self._board, score_delta = apply_move(self._board, *unpack_move(packed, self._board.cols))
+            self._score += score_delta
+        self._moves = move_count
+
+    def _read(self, offset, size):
+        self.file.seek(offset)
+        return self.file.read(size)
+
+    def end_game(self):
+        if self._board is None:
+            return
+        self._flush_moves()
+        self.file.write(b"E" + GAME_END.pack(self._moves, self._score))
+        self.games[-4] = self._moves
+        self.games[-3] = self._score
+        self._board = None
+
+    def _flush_moves(self):
+        if self._pending:
+            self.file.write(
+                b"M" + MOVE_BLOCK.pack(len(self._pending)) + struct.pack(f"<{len(self._pending)}H", *self._pending)
+            )
+            self._pending = []
+
+    def close(self):
+        # Finish the current game and write the footer index
+        if self.file.closed:
+            return
+        self.end_game()
+        footer_offset = self.file.tell()
+        self.file.write(b"F" + FOOTER.pack(len(self.games) // 5, len(self.keyframes) // 2))
+        for records in (self.games, self.keyframes):
+            if sys.byteorder == "big":
+                records.byteswap()
+            records.tofile(self.file)
+        self.file.write(TRAILER.pack(footer_offset, END_MAGIC))
+        self.file.close()
+
+
+# --- Reader ---
+class GameRecord:
+    # Lazy view of one recorded game inside a memory-mapped replay file
+    def __init__(self, data, offset, moves, score, keyframes):
+        self._data = data
+        self.offset = offset
+        self.move_count = moves
+        self.score = score
+        self.keyframes = keyframes  # [(move index, offset), ...] in increasing order, without move 0
+        self.seed, self.rows, self.cols = GAME_START.unpack_from(data, offset + 1)
+        start = offset + 1 + GAME_START.size
+        self.initial_board = board_from_bytes(data[start : start + self.rows * self.cols], self.rows, self.cols)
+        self._moves_offset = start + self.rows * self.cols
+
+    def __len__(self):
+        return self.move_count
+
+    def _iter_chunks(self, offset):
+        # Walk the chunks of this game starting at offset, yielding (tag, payload offset)
+        data = self._data
+        cells = self.rows * self.cols
+        while offset < len(data):
+            tag = data[offset : offset + 1]
+            if tag == b"M" and offset + 1 + MOVE_BLOCK.size <= len(data):
+                (count,) = MOVE_BLOCK.unpack_from(data, offset + 1)
+                size = 1 + MOVE_BLOCK.size + 2 * count
+            elif tag == b"K":
+                size = 1 + KEYFRAME.size + cells
+            else:
+                return  # End of this game
+            if offset + size > len(data):
+                return  # Truncated file
+            yield tag, offset + 1
+            offset += size
+
+    def moves(self, start_offset=None):
+        # Lazily yield (direction, spawn) for every move, starting at a chunk offset
+        data = self._data
+        for tag, payload in self._iter_chunks(self._moves_offset if start_offset is None else start_offset):
+            if tag == b"M":
+                (count,) = MOVE_BLOCK.unpack_from(data, payload)
+                for (packed,) in PACKED_MOVE.iter_unpack(data[payload + 2 : payload + 2 + 2 * count]):
+                    yield unpack_move(packed, self.cols)
+
+    def positions(self, start=0):
+        # Lazily yield (board, score, direction, spawn) after every move, from move index start on
+        # A later start seeks to the nearest keyframe instead of replaying from the beginning
+        board, score, start_offset, done = self._seek(start)
+        for direction, spawn in self.moves(start_offset):
+            board, score_delta = apply_move(board, direction, spawn)
+            score += score_delta
+            done += 1
+            if done > start:
+                yield board, score, direction, spawn
+
+    def board_at(self, move_index):
+        # Return (board, score) after move_index moves, replaying at most one keyframe interval
+        board, score, start_offset, done = self._seek(move_index)
+        for direction, spawn in self.moves(start_offset):
+            if done >= move_index:
+                break
+            board, score_delta = apply_move(board, direction, spawn)
+            score += score_delta
+            done += 1
+        return board, score
+
+    def _seek(self, move_index):
+        # Return (board, score, chunk offset, move index) of the last keyframe at or before move_index
+        if not 0 <= move_index <= self.move_count:
+            raise IndexError(f"Move {move_index} out of range 0..{self.move_count}")
+        keyframe_index, keyframe_offset = 0, self.offset
+        for candidate_index, candidate_offset in self.keyframes:
+            if candidate_index > move_index:
+                break
+            keyframe_index, keyframe_offset = candidate_index, candidate_offset
+        if keyframe_index == 0:
+            return self.initial_board, 0, self._moves_offset, 0
+        _, score = KEYFRAME.unpack_from(self._data, keyframe_offset + 1)
+        start = keyframe_offset + 1 + KEYFRAME.size
+        board = board_from_bytes(self._data[start : start + self.rows * self.cols], self.rows, self.cols)
+        return board, score, start + self.rows * self.cols, keyframe_index
+
+
+class FooterIndex:
+    # Sequence of (offset, moves, score, keyframes) entries read straight from the footer records in the
+    # mmap, so opening a file costs the same for ten games or millions
+    def __init__(self, data, games_offset, count, keyframes_offset):
+        self._data = data
+        self._games_offset = games_offset
+        self._count = count
+        self._keyframes_offset = keyframes_offset
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, game_index):
+        if game_index < 0:
+            game_index += self._count
+        if not 0 <= game_index < self._count:
+            raise IndexError(f"Game {game_index} out of range 0..{self._count - 1}")
+        offset, moves, score, first, count = FOOTER_GAME.unpack_from(
+            self._data, self._games_offset + game_index * FOOTER_GAME.size
+        )
+        start = self._keyframes_offset + first * FOOTER_KEYFRAME.size
+        keyframes = list(FOOTER_KEYFRAME.iter_unpack(self._data[start : start + count * FOOTER_KEYFRAME.size]))
+        return offset, moves, score, keyframes
+
+    def __iter__(self):
+        for game_index in range(self._count):
+            yield self[game_index]
+
+
+class ReplayReader:
+    # Memory-mapped reader; games are decoded lazily from the footer index
+    def __init__(self, path):
+        self._file = open(path, "rb")
+        self._data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version = HEADER.unpack_from(self._data, 0)
+        if magic != MAGIC:
+            raise ReplayError(f"{path} is not a replay file")
+        if version != VERSION:
+            raise ReplayError(f"Unsupported replay version {version}")
+        self.index = self._read_footer()
+        if self.index is None:
+            # The writer never closed the file (e.g. a crash), so rebuild the index by scanning
+            self.index = self._scan()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        return len(self.index)
+
+    def __getitem__(self, game_index):
+        return GameRecord(self._data, *self.index[game_index])
+
+    def __iter__(self):
+        return self.games()
+
+    def games(self):
+        # Lazily yield every recorded game
+        for entry in self.index:
+            yield GameRecord(self._data, *entry)
+
+    def close(self):
+        self._data.close()
+        self._file.close()
+
+    def _read_footer(self):
+        data = self._data
+        if len(data) < HEADER.size + TRAILER.size:
+            return None
+        footer_offset, end_magic = TRAILER.unpack_from(data, len(data) - TRAILER.size)
+        if end_magic != END_MAGIC or data[footer_offset : footer_offset + 1] != b"F":
+            return None
+        if footer_offset + 1 + FOOTER.size > len(data) - TRAILER.size:
+            return None
+        count, keyframe_count = FOOTER.unpack_from(data, footer_offset + 1)
+        games_offset = footer_offset + 1 + FOOTER.size
+        keyframes_offset = games_offset + count * FOOTER_GAME.size
+        if keyframes_offset + keyframe_count * FOOTER_KEYFRAME.size != len(data) - TRAILER.size:
+            return None
+        return FooterIndex(data, games_offset, count, keyframes_offset)
+
+    def _scan(self):
+        # Rebuild the index from the chunk stream, keeping every complete or partial game
+        data = self._data
+        index = []
+        offset = HEADER.size
+        cells = 0
+        while offset < len(data):
+            tag = data[offset : offset + 1]
+            try:
+                if tag == b"G":
+                    _, rows, cols = GAME_START.unpack_from(data, offset + 1)
+                    cells = rows * cols
+                    entry = [offset, 0, 0, []]
+                    size = 1 + GAME_START.size + cells
+                elif tag == b"M" and index:
+                    (count,) = MOVE_BLOCK.unpack_from(data, offset + 1)
+                    size = 1 + MOVE_BLOCK.size + 2 * count
+                elif tag == b"K" and index:
+                    move_index, score = KEYFRAME.unpack_from(data, offset + 1)
+                    size = 1 + KEYFRAME.size + cells
+                elif tag == b"E" and index:
+                    moves, score = GAME_END.unpack_from(data, offset + 1)
+                    size = 1 + GAME_END.size
+                else:
+                    break  # Footer or garbage
+            except struct.error:
+                break  # Truncated chunk header
+            if offset + size > len(data):
+                break  # Truncated chunk payload
+
+            if tag == b"G":
+                index.append(entry)
+            elif tag == b"M":
+                index[-1][1] += count
+            elif tag == b"K":
+                index[-1][2] = score
+                index[-1][3].append((move_index, offset))
+            elif tag == b"E":
+                index[-1][1], index[-1][2] = moves, score
+            offset += size
+        return [tuple(entry) for entry in index]
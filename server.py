@@ -0,0 +1,330 @@
+import asyncio
+import json
+import random
+import sys
+import time
+from collections import deque
+
+from engine import (
+    COLS,
+    DEFAULT_SPAWN,
+    DIRECTIONS,
+    ROWS,
+    SPAWN_DISTRIBUTIONS,
+    Board,
+    GameRandom,
+    apply_rules,
+    parse_size,
+)
+from replay import SEED_MASK, board_from_bytes, board_to_bytes
+from simulate import game_seed, percentile
+
+# --- Server Constants ---
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8048
+DEFAULT_UNDO_DEPTH = 4  # Moves each session can undo
+DEFAULT_MAX_SESSIONS = 100_000
+LATENCY_SAMPLES = 100_000  # Most recent move latencies kept for the percentiles
+MAX_LINE = 64 * 1024  # Longest request line accepted
+
+
+# --- Sessions ---
+class Session:
+    # One game held by the server: an immutable engine Board plus a few counters, no pygame objects
+    # Spawns use an RNG seeded from (seed, move number) instead of a stored generator, which keeps the
+    # session small and makes an undone move spawn the same tile when it is played again
+    __slots__ = ("board", "seed", "spawn", "score", "moves", "state", "has_kept_playing", "last_spawn", "undo_stack")
+
+    def __init__(self, seed, rows=ROWS, cols=COLS, undo_depth=DEFAULT_UNDO_DEPTH, spawn=DEFAULT_SPAWN):
+        self.seed = seed
+        self.spawn = spawn  # Name of the engine spawn distribution
+        self.board = Board.new_game(GameRandom(game_seed(seed, 0), spawn), rows, cols)
+        self.score = 0
+        self.moves = 0
+        self.state = "playing"  # Same states as engine.Game: "playing", "won", "lost"
+        self.has_kept_playing = False
+        self.last_spawn = None
+        # (board bytes, score, moves, state, has_kept_playing, last_spawn) before each recent move
+        self.undo_stack = deque(maxlen=undo_depth)
+
+    def move(self, direction):
+        # Apply one move with the engine.Game rules (engine.apply_rules); returns whether any tile moved or merged
+        if self.state != "playing":
+            return False
+        board, score_delta, moved = self.board.move(direction)
+        if not moved:
+            _, self.state, _ = apply_rules(board, moved, self.has_kept_playing, None)
+            return False
+
+        if self.undo_stack.maxlen:
+            self.undo_stack.append(
+                (
+                    board_to_bytes(self.board),
+                    self.score,
+                    self.moves,
+                    self.state,
+                    self.has_kept_playing,
+                    self.last_spawn,
+                )
+            )
+        self.score += score_delta
+        self.moves += 1
+        self.board, self.state, self.last_spawn = apply_rules(board, moved, self.has_kept_playing, self._spawn)
+        return True
+
+    def _spawn(self, board):
+        return board.spawn(GameRandom(game_seed(self.seed, self.moves), self.spawn))
+
+    def undo(self):
+        if not self.undo_stack:
+            return False
+        cells, self.score, self.moves, self.state, self.has_kept_playing, self.last_spawn = self.undo_stack.pop()
+        self.board = board_from_bytes(cells, self.board.rows, self.board.cols)
+        return True
+
+    def keep_playing(self):
+        if self.state == "won":
+            self.state = "playing"
+            self.has_kept_playing = True
+
+    def to_dict(self):
+        return {
+            "board": self.board.to_rows(),
+            "score": self.score,
+            "moves": self.moves,
+            "state": self.state,
+            "spawn": self.last_spawn,
+        }
+
+    def nbytes(self):
+        # Approximate memory held by the session, its board and its undo entries
+        size = sys.getsizeof(self) + sys.getsizeof(self.board) + sys.getsizeof(self.board.cells)
+        size += sys.getsizeof(self.undo_stack)
+        for entry in self.undo_stack:
+            size += sys.getsizeof(entry) + sys.getsizeof(entry[0])
+        return size
+
+
+# --- Protocol ---
+# One JSON object per line in each direction. Every request has an "op"; an optional "id" is echoed
+# back so clients can pipeline requests. Replies carry "ok" and either the result or an "error".
+#   {"op": "new", "size": "4x4", "seed": 1, "distribution": "classic"}
+#                                                  -> {"ok": true, "session": 1, "board": [[...]], ...}
+#   {"op": "move", "session": 1, "direction": "left"} -> {"ok": true, "moved": true, "board": ..., ...}
+#   {"op": "state", "session": 1}                  -> {"ok": true, "board": ..., "score": ..., ...}
+#   {"op": "undo", "session": 1}                   -> {"ok": true, "undone": true, "board": ..., ...}
+#   {"op": "continue", "session": 1}               -> keep playing after reaching the winning tile
+#   {"op": "close", "session": 1}                  -> forget the session
+#   {"op": "stats"}                                -> sessions, memory and move latency percentiles
+class ProtocolError(Exception):
+    pass
+
+
+class GameServer:
+    # Holds every session in memory; the server never draws anything, so requests are answered
+    # straight from the event loop without waiting on rendering
+    def __init__(self, undo_depth=DEFAULT_UNDO_DEPTH, max_sessions=DEFAULT_MAX_SESSIONS):
+        self.undo_depth = undo_depth
+        self.max_sessions = max_sessions
+        self.sessions = {}
+        self.next_session = 1
+        self.latencies = deque(maxlen=LATENCY_SAMPLES)  # Seconds spent handling each move
+        self.requests = 0
+        self.server = None
+        self.connections = set()  # Writers of the open client connections, closed on stop
+
+    def get_session(self, request):
+        session_id = request.get("session")
+        session = self.sessions.get(session_id) if isinstance(session_id, int) else None
+        if session is None:
+            raise ProtocolError(f"Unknown session: {request.get('session')!r}")
+        return session
+
+    def handle(self, request):
+        # Answer one decoded request, returning the reply dictionary
+        op = request.get("op")
+        if op == "move":
+            start = time.perf_counter()
+            session = self.get_session(request)
+            direction = request.get("direction")
+            if direction not in DIRECTIONS:
+                raise ProtocolError(f"Invalid direction: {direction!r}")
+            reply = {"moved": session.move(direction), **session.to_dict()}
+            self.latencies.append(time.perf_counter() - start)
+            return reply
+        if op == "new":
+            if len(self.sessions) >= self.max_sessions:
+                raise ProtocolError("Too many sessions")
+            try:
+                rows, cols = parse_size(str(request.get("size", f"{ROWS}x{COLS}")))
+            except ValueError as error:
+                raise ProtocolError(str(error)) from None
+            spawn = request.get("distribution", DEFAULT_SPAWN)
+            if not isinstance(spawn, str) or spawn not in SPAWN_DISTRIBUTIONS:
+                raise ProtocolError(f"Unknown spawn distribution: {spawn!r}")
+            seed = request.get("seed")
+            if not isinstance(seed, int):
+                seed = random.randrange(1 << 63)
+            session_id = self.next_session
+            self.next_session += 1
+            session = self.sessions[session_id] = Session(seed & SEED_MASK, rows, cols, self.undo_depth, spawn)
+            return {"session": session_id, "seed": session.seed, "distribution": spawn, **session.to_dict()}
+        if op == "state":
+            return self.get_session(request).to_dict()
+        if op == "undo":
+            session = self.get_session(request)
+            return {"undone": session.undo(), **session.to_dict()}
+        if op == "continue":
+            session = self.get_session(request)
+            session.keep_playing()
+            return session.to_dict()
+        if op == "close":
+            self.get_session(request)
+            del self.sessions[request["session"]]
+            return {}
+        if op == "stats":
+            return self.stats()
+        raise ProtocolError(f"Unknown op: {op!r}")
+
+    def stats(self):
+        latencies = sorted(self.latencies)
+        session_bytes = sum(session.nbytes() for session in self.sessions.values())
+        return {
+            "sessions": len(self.sessions),
+            "requests": self.requests,
+            "session_bytes": session_bytes,
+            "sessions_per_mb": round(len(self.sessions) / (session_bytes / (1 << 20)), 1) if session_bytes else 0.0,
+            "move_latency_us": {
+                "samples": len(latencies),
+                "p50": round(percentile(latencies, 0.50) * 1e6, 1),
+                "p99": round(percentile(latencies, 0.99) * 1e6, 1),
+            },
+        }
+
+    def respond(self, line):
+        # Decode one request line and encode its reply line
+        self.requests += 1
+        request_id = None
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise ProtocolError("Requests must be JSON objects")
+            request_id = request.get("id")
+            reply = {"ok": True, **self.handle(request)}
+        except (ValueError, ProtocolError) as error:
+            reply = {"ok": False, "error": str(error)}
+        if request_id is not None:
+            reply["id"] = request_id
+        return json.dumps(reply, separators=(",", ":")).encode() + b"\n"
+
+    async def handle_connection(self, reader, writer):
+        self.connections.add(writer)
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except (asyncio.LimitOverrunError, ValueError):
+                    writer.write(b'{"ok":false,"error":"Request line too long"}\n')
+                    break
+                if not line:
+                    break
+                if line.strip():
+                    writer.write(self.respond(line))
+                    await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            self.connections.discard(writer)
+            writer.close()
+
+    async def start(self, host=DEFAULT_HOST, port=DEFAULT_PORT):
+        self.server = await asyncio.start_server(self.handle_connection, host, port, limit=MAX_LINE)
+        return self.server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        if self.server is not None:
+            self.server.close()
+            for writer in list(self.connections):
+                writer.close()
+            await self.server.wait_closed()
+            await asyncio.sleep(0)  # Let the connection handlers see the closed sockets and return
+
+
+# --- Client Harness ---
+async def request(reader, writer, message):
+    writer.write(json.dumps(message).encode() + b"\n")
+    await writer.drain()
+    return json.loads(await reader.readline())
+
+
+async def play_client(host, port, sessions, moves, seed):
+    # One connection that opens sessions and plays random moves on them in turn
+    reader, writer = await asyncio.open_connection(host, port, limit=MAX_LINE)
+    rng = random.Random(seed)
+    session_ids = []
+    for index in range(sessions):
+        reply = await request(reader, writer, {"op": "new", "seed": seed * sessions + index})
+        session_ids.append(reply["session"])
+    for _ in range(moves):
+        for session_id in session_ids:
+            reply = await request(
+                reader, writer, {"op": "move", "session": session_id, "direction": rng.choice(DIRECTIONS)}
+            )
+            if not reply["ok"]:
+                raise RuntimeError(reply["error"])
+            if reply["state"] == "won":
+                await request(reader, writer, {"op": "continue", "session": session_id})
+    writer.close()
+    await writer.wait_closed()
+
+
+async def run_harness(host, port, sessions, clients, moves):
+    # Open `sessions` games across `clients` connections, play `moves` moves on each,
+    # and return the server statistics
+    clients = max(1, min(clients, sessions))
+    per_client = [sessions // clients + (index < sessions % clients) for index in range(clients)]
+    await asyncio.gather(*(play_client(host, port, count, moves, index) for index, count in enumerate(per_client)))
+    reader, writer = await asyncio.open_connection(host, port)
+    stats = await request(reader, writer, {"op": "stats"})
+    writer.close()
+    await writer.wait_closed()
+    return stats
+
+
+# --- Command Line ---
+def add_arguments(parser):
+    parser.add_argument("--host", default=DEFAULT_HOST, help="address to listen on")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="port to listen on (0 picks a free port)")
+    parser.add_argument("--undo-depth", type=int, default=DEFAULT_UNDO_DEPTH, help="moves each session can undo")
+    parser.add_argument("--max-sessions", type=int, default=DEFAULT_MAX_SESSIONS, help="sessions held at once")
+    parser.add_argument(
+        "--harness",
+        type=int,
+        metavar="SESSIONS",
+        default=None,
+        help="run the local client harness with this many sessions, print the stats and exit",
+    )
+    parser.add_argument("--harness-clients", type=int, default=100, help="connections used by the harness")
+    parser.add_argument("--harness-moves", type=int, default=20, help="moves played on every harness session")
+    parser.set_defaults(run=run)
+
+
+async def serve(args):
+    server = GameServer(args.undo_depth, args.max_sessions)
+    port = await server.start(args.host, args.port)
+    try:
+        if args.harness is not None:
+            stats = await run_harness(args.host, port, args.harness, args.harness_clients, args.harness_moves)
+            print(json.dumps(stats, indent=2))
+            return
+        print(f"Serving 2048 on {args.host}:{port}", flush=True)
+        await server.server.serve_forever()
+    finally:
+        await server.stop()
+
+
+def run(args):
+    try:
+        asyncio.run(serve(args))
+    except KeyboardInterrupt:
+        pass
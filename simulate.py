@@ -0,0 +1,306 @@
+import argparse
+import hashlib
+import json
+import multiprocessing
+import os
+import random
+import time
+from collections import Counter
+
+from engine import COLS, DEFAULT_SPAWN, DIRECTIONS, ROWS, SPAWN_DISTRIBUTIONS, Game, GameRandom, check_size, parse_size
+from positions import PositionStore
+from replay import ReplayWriter
+
+# --- Simulation Constants ---
+POLICIES = ("random", "greedy", "expectimax")
+DEFAULT_CHUNK_SIZE = 50  # Games played per task sent to a worker
+DEFAULT_SEARCH_DEPTH = 2  # Fixed expectimax depth, so results do not depend on machine speed
+
+
+# --- Policies ---
+def legal_moves(board):
+    # Return (direction, score_delta) for every direction that changes the board
+    moves = []
+    for direction in DIRECTIONS:
+        _, score_delta, moved = board.move(direction)
+        if moved:
+            moves.append((direction, score_delta))
+    return moves
+
+
+def random_policy(board, rng):
+    # Pick uniformly among the moves that change the board
+    moves = legal_moves(board)
+    return rng.choice(moves)[0] if moves else None
+
+
+def greedy_policy(board, rng):
+    # Pick the move with the largest immediate score, breaking ties randomly
+    moves = legal_moves(board)
+    if not moves:
+        return None
+    best_score = max(score_delta for _, score_delta in moves)
+    return rng.choice([direction for direction, score_delta in moves if score_delta == best_score])
+
+
+def make_policy(name, search_depth=DEFAULT_SEARCH_DEPTH, spawn=DEFAULT_SPAWN):
+    # Return a policy(board, rng) -> direction callable, plus a hook run at the start of every game
+    if name == "random":
+        return random_policy, None
+    if name == "greedy":
+        return greedy_policy, None
+    if name == "expectimax":
+        from ai import Searcher
+
+        searcher = Searcher(spawn=spawn)
+
+        def expectimax_policy(board, rng):
+            return searcher.best_move(board, time_budget_ms=None, max_depth=search_depth)
+
+        # A fresh table per game keeps every game independent of which worker played it
+        return expectimax_policy, searcher.table.clear
+    raise ValueError(f"Unknown policy: {name!r}")
+
+
+# --- Game Playing ---
+def game_seed(seed, index):
+    # Each game gets its own seed derived from the run seed and the game index,
+    # so the results do not depend on how games are split across workers
+    # Both numbers are hashed in full, so no two (seed, index) pairs share a stream short of a 64-bit collision
+    digest = hashlib.blake2b(f"{seed}:{index}".encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "little")
+
+
+def play_game(game, policy, rng, max_moves=None, writer=None, moves=None):
+    # Play until the game is lost, continuing past the win screen like pressing C in the GUI
+    # Every move is recorded when a ReplayWriter is given, and appended as (board, direction) to moves
+    # when a list is given
+    # Returns whether the winning tile was reached
+    won = False
+    while game.state != "lost" and (max_moves is None or game.moves < max_moves):
+        if game.state == "won":
+            won = True
+            game.keep_playing()
+        direction = policy(game.board, rng)
+        if direction is None:
+            break
+        board = game.board if moves is not None else None
+        if game.move(direction):
+            if writer is not None:
+                writer.record_move(direction, game.last_spawn)
+            if moves is not None:
+                moves.append((board, direction))
+    return won or game.state == "won"
+
+
+def play_chunk(task):
+    # Play a contiguous range of games and return aggregate results, keeping IPC to one message per chunk
+    seed, start, count, policy_name, search_depth, max_moves, record_dir, rows, cols, spawn, positions = task
+    policy, on_new_game = make_policy(policy_name, search_depth, spawn)
+    result = new_result()
+    writer = None
+    # Positions are collected in memory and sent back for the parent to merge into the store file
+    store = PositionStore(None, rows, cols) if positions else None
+    if record_dir is not None:
+        # One replay file per chunk, so workers never share a file
+        writer = ReplayWriter(os.path.join(record_dir, f"games-{start:010d}.bin"))
+    for index in range(start, start + count):
+        if on_new_game is not None:
+            on_new_game()
+        spawn_seed = game_seed(seed, index)
+        policy_rng = random.Random(f"{seed}:{index}:policy")
+        game = Game(GameRandom(spawn_seed, spawn), rows, cols)
+        if writer is not None:
+            writer.start_game(game.board, spawn_seed)
+        moves = [] if store is not None else None
+        won = play_game(game, policy, policy_rng, max_moves, writer, moves)
+        if store is not None:
+            store.record_game(moves, game.score)
+        result["games"] += 1
+        result["moves"] += game.moves
+        result["wins"] += won
+        result["max_tiles"][game.board.max_tile()] += 1
+        result["scores"].append(game.score)
+    if writer is not None:
+        writer.close()
+    if store is not None:
+        result["positions"] = store.pending
+    return result
+
+
+# --- Aggregation ---
+def new_result():
+    return {"games": 0, "moves": 0, "wins": 0, "max_tiles": Counter(), "scores": []}
+
+
+def merge_results(total, result, store=None):
+    total["games"] += result["games"]
+    total["moves"] += result["moves"]
+    total["wins"] += result["wins"]
+    total["max_tiles"].update(result["max_tiles"])
+    total["scores"].extend(result["scores"])
+    if store is not None:
+        store.merge(result["positions"])
+    return total
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+def summarise(total, elapsed, config):
+    # Turn the raw totals into the report printed at the end of a run
+    scores = sorted(total["scores"])
+    games = total["games"]
+    return {
+        **config,
+        "games": games,
+        "moves": total["moves"],
+        "elapsed_seconds": round(elapsed, 3),
+        "games_per_second": round(games / elapsed, 2) if elapsed else 0.0,
+        "moves_per_second": round(total["moves"] / elapsed, 2) if elapsed else 0.0,
+        "win_rate": total["wins"] / games if games else 0.0,
+        "max_tile_distribution": {str(tile): total["max_tiles"][tile] for tile in sorted(total["max_tiles"])},
+        "score_distribution": {
+            "mean": round(sum(scores) / games, 2) if games else 0.0,
+            "min": scores[0] if scores else 0,
+            "p25": percentile(scores, 0.25),
+            "p50": percentile(scores, 0.50),
+            "p75": percentile(scores, 0.75),
+            "p90": percentile(scores, 0.90),
+            "p99": percentile(scores, 0.99),
+            "max": scores[-1] if scores else 0,
+        },
+    }
+
+
+def simulate(
+    games,
+    workers=1,
+    policy="random",
+    seed=0,
+    chunk_size=DEFAULT_CHUNK_SIZE,
+    search_depth=DEFAULT_SEARCH_DEPTH,
+    max_moves=None,
+    record_dir=None,
+    rows=ROWS,
+    cols=COLS,
+    spawn=DEFAULT_SPAWN,
+    positions=None,
+):
+    # Play the games across a process pool and return the summary dictionary
+    # With record_dir set, every game is saved to replay files in that directory
+    # With positions set, every position played is added to the position store file at that path,
+    # with the final score of its game as the outcome
+    if policy not in POLICIES:
+        raise ValueError(f"Unknown policy: {policy!r}")
+    check_size(rows, cols)
+    if spawn not in SPAWN_DISTRIBUTIONS:
+        raise ValueError(f"Unknown spawn distribution: {spawn!r}")
+    if policy == "expectimax" and (rows, cols) != (4, 4):
+        raise ValueError("The expectimax policy only supports 4x4 boards")
+    if record_dir is not None:
+        os.makedirs(record_dir, exist_ok=True)
+    store = PositionStore(positions, rows, cols) if positions is not None else None
+    tasks = [
+        (
+            seed,
+            start,
+            min(chunk_size, games - start),
+            policy,
+            search_depth,
+            max_moves,
+            record_dir,
+            rows,
+            cols,
+            spawn,
+            store is not None,
+        )
+        for start in range(0, games, chunk_size)
+    ]
+    total = new_result()
+    start_time = time.perf_counter()
+    if workers <= 1:
+        for task in tasks:
+            merge_results(total, play_chunk(task), store)
+    else:
+        with multiprocessing.Pool(workers) as pool:
+            # Chunks come back as soon as they finish; the totals do not depend on the order
+            for result in pool.imap_unordered(play_chunk, tasks):
+                merge_results(total, result, store)
+    if store is not None:
+        store.flush()
+    elapsed = time.perf_counter() - start_time
+    config = {"policy": policy, "seed": seed, "workers": workers, "size": f"{rows}x{cols}", "spawn": spawn}
+    summary = summarise(total, elapsed, config)
+    if store is not None:
+        summary["positions"] = {"path": positions, "stored": len(store), "recorded": total["moves"]}
+        store.close()
+    return summary
+
+
+def format_summary(summary):
+    scores = summary["score_distribution"]
+    lines = [
+        f"policy={summary['policy']} size={summary['size']} spawn={summary['spawn']} seed={summary['seed']} "
+        f"workers={summary['workers']}",
+        f"games={summary['games']} moves={summary['moves']} elapsed={summary['elapsed_seconds']}s",
+        f"games/sec={summary['games_per_second']:,.2f} moves/sec={summary['moves_per_second']:,.2f}",
+        f"win rate={summary['win_rate']:.2%}",
+        "score: " + " ".join(f"{name}={value}" for name, value in scores.items()),
+        "max tile:",
+    ]
+    for tile, count in summary["max_tile_distribution"].items():
+        lines.append(f"  {tile:>6}: {count} ({count / summary['games']:.2%})")
+    if "positions" in summary:
+        positions = summary["positions"]
+        lines.append(
+            f"positions: {positions['stored']:,} stored for {positions['recorded']:,} moves in {positions['path']}"
+        )
+    return "\n".join(lines)
+
+
+# --- Command Line ---
+def size_argument(text):
+    try:
+        return parse_size(text)
+    except ValueError as error:
+        raise argparse.ArgumentTypeError(str(error)) from None
+
+
+def add_arguments(parser):
+    parser.add_argument("--games", type=int, default=1000, help="number of games to play")
+    parser.add_argument("--workers", type=int, default=multiprocessing.cpu_count(), help="worker processes")
+    parser.add_argument("--policy", choices=POLICIES, default="random", help="how moves are chosen")
+    parser.add_argument("--size", type=size_argument, default=(ROWS, COLS), help="board size as RxC, up to 16x16")
+    parser.add_argument("--seed", type=int, default=0, help="run seed; results are identical for any worker count")
+    parser.add_argument(
+        "--spawn", choices=SPAWN_DISTRIBUTIONS, default=DEFAULT_SPAWN, help="tile value distribution (classic is 90/10)"
+    )
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="games per worker task")
+    parser.add_argument("--depth", type=int, default=DEFAULT_SEARCH_DEPTH, help="expectimax search depth")
+    parser.add_argument("--max-moves", type=int, default=None, help="stop each game after this many moves")
+    parser.add_argument("--record", metavar="DIR", default=None, help="save every game as replay files in DIR")
+    parser.add_argument("--positions", metavar="FILE", default=None, help="add every position played to a store")
+    parser.add_argument("--json", action="store_true", help="print the summary as JSON")
+    parser.set_defaults(run=run)
+
+
+def run(args):
+    summary = simulate(
+        args.games,
+        workers=args.workers,
+        policy=args.policy,
+        seed=args.seed,
+        chunk_size=args.chunk_size,
+        search_depth=args.depth,
+        max_moves=args.max_moves,
+        record_dir=args.record,
+        rows=args.size[0],
+        cols=args.size[1],
+        spawn=args.spawn,
+        positions=args.positions,
+    )
+    print(json.dumps(summary, indent=2) if args.json else format_summary(summary))
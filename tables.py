@@ -0,0 +1,259 @@
+import argparse
+import hashlib
+import mmap
+import os
+import struct
+import sys
+import tempfile
+import time
+import zlib
+
+from engine import merge_line
+
+# --- Row Layout ---
+# Every table is indexed by one 16-bit bitboard row: four 4-bit exponents, column 0 in the lowest nibble
+SIZE = 4
+ROW_MASK = 0xFFFF
+CELL_MASK = 0xF
+MAX_EXPONENT = 15  # Largest exponent a nibble can hold (32768)
+ROW_COUNT = 1 << 16
+
+# Heuristic weights for a single row, applied to every row and every column by the AI
+LOST_PENALTY = 200000.0
+MONOTONICITY_POWER = 4.0
+MONOTONICITY_WEIGHT = 47.0
+SUM_POWER = 3.5
+SUM_WEIGHT = 11.0
+MERGES_WEIGHT = 700.0
+EMPTY_WEIGHT = 270.0
+SMOOTHNESS_WEIGHT = 20.0
+
+# --- Table File ---
+# A little-endian header followed by the tables in native byte order (memoryview casts are native),
+# each table ROW_COUNT entries long:
+#   magic (8s), version (u32), row count (u32), generator fingerprint (32s), CRC-32 of the tables (u32),
+#   padding up to HEADER_SIZE
+#   left (u16): row after sliding towards column 0
+#   right (u16): row after sliding towards column 3
+#   score (u32): score gained by either slide
+#   heuristic (f64): AI evaluation of the row
+# The fingerprint hashes the generator settings and the byte order, so changing a weight or the version
+# regenerates the file.
+MAGIC = b"2048TBL\x00"
+TABLE_VERSION = 1
+HEADER = struct.Struct("<8sII32sI")
+HEADER_SIZE = 64  # Keeps the f64 table 8-byte aligned
+TABLES = (("left", "H"), ("right", "H"), ("score", "I"), ("heuristic", "d"))
+# Per-user cache directory shared by every file the game caches (row tables, fonts, position stores)
+CACHE_DIR = os.path.join(
+    os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache"), "2048-python"
+)
+DEFAULT_PATH = os.path.join(CACHE_DIR, f"row-tables-v{TABLE_VERSION}.bin")
+
+
+class TableError(Exception):
+    pass
+
+
+def fingerprint():
+    settings = (
+        TABLE_VERSION,
+        sys.byteorder,
+        SIZE,
+        MAX_EXPONENT,
+        LOST_PENALTY,
+        MONOTONICITY_POWER,
+        MONOTONICITY_WEIGHT,
+        SUM_POWER,
+        SUM_WEIGHT,
+        MERGES_WEIGHT,
+        EMPTY_WEIGHT,
+        SMOOTHNESS_WEIGHT,
+    )
+    return hashlib.sha256(repr(settings).encode()).digest()
+
+
+# --- Generation ---
+def row_to_values(row):
+    return [1 << ((row >> (4 * col)) & CELL_MASK) if (row >> (4 * col)) & CELL_MASK else 0 for col in range(SIZE)]
+
+
+def values_to_row(values):
+    row = 0
+    for col, value in enumerate(values):
+        if value:
+            # Tiles beyond 32768 cannot be stored, so merges saturate at MAX_EXPONENT
+            row |= min(value.bit_length() - 1, MAX_EXPONENT) << (4 * col)
+    return row
+
+
+def row_heuristic(row):
+    # Score one row of exponents: reward empty cells and merges, penalise non-monotonic and uneven rows
+    exponents = [(row >> (4 * col)) & CELL_MASK for col in range(SIZE)]
+    total = 0.0
+    empty = 0
+    merges = 0
+    previous = 0
+    counter = 0
+    for exponent in exponents:
+        total += exponent**SUM_POWER
+        if exponent == 0:
+            empty += 1
+        else:
+            if previous == exponent:
+                counter += 1
+            elif counter > 0:
+                merges += 1 + counter
+                counter = 0
+            previous = exponent
+    if counter > 0:
+        merges += 1 + counter
+
+    monotonicity_left = 0.0
+    monotonicity_right = 0.0
+    for col in range(1, SIZE):
+        if exponents[col - 1] > exponents[col]:
+            monotonicity_left += exponents[col - 1] ** MONOTONICITY_POWER - exponents[col] ** MONOTONICITY_POWER
+        else:
+            monotonicity_right += exponents[col] ** MONOTONICITY_POWER - exponents[col - 1] ** MONOTONICITY_POWER
+
+    # Smoothness: exponent steps between neighbouring tiles, skipping empty cells between them
+    tiles = [exponent for exponent in exponents if exponent]
+    roughness = sum(abs(tiles[index] - tiles[index - 1]) for index in range(1, len(tiles)))
+
+    return (
+        LOST_PENALTY
+        + EMPTY_WEIGHT * empty
+        + MERGES_WEIGHT * merges
+        - MONOTONICITY_WEIGHT * min(monotonicity_left, monotonicity_right)
+        - SUM_WEIGHT * total
+        - SMOOTHNESS_WEIGHT * roughness
+    )
+
+
+def generate():
+    # Build every table from the engine's line merge and the row heuristic; returns the packed tables
+    left, right, score, heuristic = [], [], [], []
+    for row in range(ROW_COUNT):
+        values = row_to_values(row)
+        merged_left, row_score = merge_line(values)
+        merged_right, _ = merge_line(values[::-1])
+        left.append(values_to_row(merged_left))
+        right.append(values_to_row(merged_right[::-1]))
+        score.append(row_score)
+        heuristic.append(row_heuristic(row))
+    columns = {"left": left, "right": right, "score": score, "heuristic": heuristic}
+    return b"".join(struct.pack(f"={ROW_COUNT}{code}", *columns[name]) for name, code in TABLES)
+
+
+def write(path, payload=None):
+    # Write the table file atomically, so concurrent workers never see a half-written file
+    if payload is None:
+        payload = generate()
+    header = HEADER.pack(MAGIC, TABLE_VERSION, ROW_COUNT, fingerprint(), zlib.crc32(payload))
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    descriptor, temporary = tempfile.mkstemp(dir=directory, prefix=".row-tables-")
+    try:
+        with os.fdopen(descriptor, "wb") as file:
+            file.write(header.ljust(HEADER_SIZE, b"\x00"))
+            file.write(payload)
+        os.chmod(temporary, 0o644)  # mkstemp creates private files, but other users may share the tables
+        os.replace(temporary, path)
+    except BaseException:
+        os.unlink(temporary)
+        raise
+    return payload
+
+
+# --- Loading ---
+class RowTables:
+    # The tables as read-only memoryviews; when loaded from a file they point straight into the
+    # mapped pages, so every process using the same file shares one physical copy
+    def __init__(self, buffer, source):
+        self.buffer = buffer
+        self.source = source  # Path of the mapped file, or None when generated in memory
+        view = memoryview(buffer)
+        offset = 0
+        for name, code in TABLES:
+            size = ROW_COUNT * struct.calcsize(code)
+            setattr(self, name, view[offset : offset + size].cast(code))
+            offset += size
+
+
+def check_header(data):
+    if len(data) < HEADER_SIZE:
+        raise TableError("Table file is truncated")
+    magic, version, rows, file_fingerprint, checksum = HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise TableError("Not a table file")
+    if version != TABLE_VERSION or rows != ROW_COUNT or file_fingerprint != fingerprint():
+        raise TableError("Table file was generated with different settings")
+    expected = sum(ROW_COUNT * struct.calcsize(code) for _, code in TABLES)
+    if len(data) != HEADER_SIZE + expected:
+        raise TableError("Table file has the wrong size")
+    return checksum
+
+
+def open_tables(path):
+    # Map an existing table file read-only, verifying its header and checksum
+    with open(path, "rb") as file:
+        mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        checksum = check_header(mapped)
+        if zlib.crc32(memoryview(mapped)[HEADER_SIZE:]) != checksum:
+            raise TableError("Table file checksum mismatch")
+    except (TableError, struct.error):
+        mapped.close()
+        raise
+    return RowTables(memoryview(mapped)[HEADER_SIZE:], path)
+
+
+def load(path=DEFAULT_PATH, regenerate=True):
+    # Map the table file, regenerating it when it is missing, stale or corrupt
+    # When the file cannot be written the tables are still generated, just kept in memory
+    try:
+        return open_tables(path)
+    except (OSError, ValueError, TableError):
+        if not regenerate:
+            raise
+    payload = generate()
+    try:
+        write(path, payload)
+        return open_tables(path)
+    except (OSError, ValueError, TableError):
+        return RowTables(payload, None)
+
+
+_TABLES = None
+
+
+def get_tables():
+    # Tables shared by bitboard and ai, loaded once per process
+    global _TABLES
+    if _TABLES is None:
+        _TABLES = load(os.environ.get("ROW_TABLES_PATH") or DEFAULT_PATH)
+    return _TABLES
+
+
+# --- Command Line ---
+def main():
+    parser = argparse.ArgumentParser(description="Generate or check the precomputed 4x4 row tables")
+    parser.add_argument("--path", default=os.environ.get("ROW_TABLES_PATH") or DEFAULT_PATH, help="table file")
+    parser.add_argument("--force", action="store_true", help="regenerate even if the file is valid")
+    args = parser.parse_args()
+
+    if not args.force:
+        try:
+            open_tables(args.path)
+            print(f"{args.path}: valid (version {TABLE_VERSION})")
+            return
+        except (OSError, ValueError, TableError) as error:
+            print(f"{args.path}: {error}, regenerating")
+    start = time.perf_counter()
+    write(args.path)
+    print(f"{args.path}: generated in {time.perf_counter() - start:.2f}s ({os.path.getsize(args.path):,} bytes)")
+
+
+if __name__ == "__main__":
+    main()